@@ -0,0 +1,116 @@
+import math
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable
+
+class AdmissionRejected(Exception):
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        """Raised when a call is refused; carries the HTTP status and Retry-After seconds."""
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class SingleFlight:
+    def __init__(self):
+        """Coalesce concurrent calls with the same key into one execution."""
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn once per key at a time; concurrent callers share its result or exception."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                self.stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return future.result()
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrent: int = 4, max_queue: int = 32, queue_timeout: float = 10.0):
+        """Bound concurrent calls, queueing the rest first-come-first-served up to a deadline.
+
+        A full queue is rejected immediately with 429; a caller whose deadline
+        passes while queued gets 503. Both carry a Retry-After estimate.
+        """
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+        # Exponentially weighted service time, used for Retry-After
+        self._avg_service = 1.0
+        self.stats = {'admitted': 0, 'queued': 0, 'rejected_full': 0, 'rejected_timeout': 0}
+
+    def _retry_after(self) -> int:
+        backlog = len(self._queue) + self._active
+        return max(1, math.ceil(backlog * self._avg_service / self.max_concurrent))
+
+    @contextmanager
+    def admit(self, timeout: float = None):
+        """Hold a concurrency slot for the duration of the block."""
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            if self._active < self.max_concurrent and not self._queue:
+                self._active += 1
+            else:
+                if len(self._queue) >= self.max_queue:
+                    self.stats['rejected_full'] += 1
+                    raise AdmissionRejected(f"{self.name} is at capacity", 429, self._retry_after())
+
+                ticket = object()
+                self._queue.append(ticket)
+                self.stats['queued'] += 1
+                while not (self._queue[0] is ticket and self._active < self.max_concurrent):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._queue.remove(ticket)
+                        self._cond.notify_all()
+                        self.stats['rejected_timeout'] += 1
+                        raise AdmissionRejected(f"{self.name} queue wait exceeded", 503, self._retry_after())
+                    self._cond.wait(remaining)
+                self._queue.popleft()
+                self._active += 1
+                # Let the next waiter re-check now that the head has moved
+                self._cond.notify_all()
+            self.stats['admitted'] += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._avg_service = 0.8 * self._avg_service + 0.2 * (time.monotonic() - started)
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return counters plus current load."""
+        with self._cond:
+            return {
+                **self.stats,
+                'active': self._active,
+                'waiting': len(self._queue),
+                'avg_service_s': round(self._avg_service, 3)
+            }
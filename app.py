@@ -1,8 +1,10 @@
 from flask import Flask, render_template, request, jsonify, session
 from werkzeug.utils import secure_filename
 import os
-from tools import search_documents, get_llm_response
-from embedder import get_embedder
+from tools import search_documents, get_llm_response, get_admission_stats
+from admission import AdmissionRejected
+from embedder import get_embedder, get_tenant_manager
+from tenants import DEFAULT_TENANT, validate_tenant_id
 from chat_history import ChatHistoryManager
 import logging
 import uuid
@@ -26,11 +28,49 @@ app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev-key-123')
 chat_history = ChatHistoryManager()
 embedder = get_embedder()
 
-# Process any existing PDFs at startup
-try:
-    embedder.process_new_pdfs()
-except Exception as e:
-    print(f"Error initializing PDFEmbedder: {str(e)}")
+def start_background_tasks():
+    """Start the chat archiver and PDF ingestion in the process that serves requests.
+    
+    Serving workers (REAIC_ROLE=serve) only read snapshots published by
+    ingest_worker.py. Otherwise every tenant's PDF directory is scanned when
+    its shard is loaded and watched while it stays loaded.
+    """
+    # Compact cold conversations into compressed segments in the background
+    chat_history.start_archiver()
+    if not embedder.read_only:
+        get_tenant_manager().enable_auto_ingest()
+
+if __name__ != '__main__':
+    # Imported by a WSGI server: this process serves requests
+    start_background_tasks()
+
+def resolve_tenant(data):
+    """Return (tenant_id, None) for the request, or (None, error response).
+    
+    The tenant comes from the API key (Authorization: Bearer <key> or
+    X-API-Key, configured in TENANT_API_KEYS); requests without a key use the
+    default tenant. A tenant_id field or X-Tenant-ID header may be sent but
+    must name that same tenant.
+    """
+    auth = request.headers.get('Authorization', '')
+    api_key = auth[7:].strip() if auth.lower().startswith('bearer ') else request.headers.get('X-API-Key')
+    requested = data.get('tenant_id') or request.headers.get('X-Tenant-ID')
+    try:
+        requested = validate_tenant_id(requested) if requested else None
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    
+    if api_key:
+        tenant_id = get_tenant_manager().authenticate(api_key)
+        if tenant_id is None:
+            return None, (jsonify({'error': 'Invalid API key'}), 401)
+    else:
+        tenant_id = DEFAULT_TENANT
+    
+    if requested and requested != tenant_id:
+        status = 403 if api_key else 401
+        return None, (jsonify({'error': f"Not authorized for tenant {requested}"}), status)
+    return tenant_id, None
 
 @app.route('/')
 def home():
@@ -47,12 +87,22 @@ def chat():
         
         if not message:
             return jsonify({'error': 'Empty message'}), 400
+        
+        # Route retrieval to the caller's tenant index
+        tenant_id, error = resolve_tenant(data)
+        if error:
+            return error
             
         if not conversation_id:
             conversation_id = str(uuid.uuid4())
             
-        # Get existing conversation or initialize new one
-        conversation = chat_history.get_conversation(conversation_id)
+        # Get existing conversation or initialize new one. A read error must not
+        # start over: saving would replace the stored history with this turn.
+        try:
+            conversation = chat_history.get_conversation(conversation_id)
+        except Exception as e:
+            logger.error(f"Could not load conversation {conversation_id}: {str(e)}")
+            return jsonify({'error': 'Conversation history is temporarily unavailable, please retry'}), 503
         if conversation:
             messages = conversation.get('messages', [])
         else:
@@ -70,13 +120,15 @@ def chat():
         })
         
         # Search for relevant documents
-        results = search_documents(message)
+        results = search_documents(message, tenant_id=tenant_id, filters=data.get('filters'))
         
-        # Get LLM response with full conversation history
+        # Get LLM response with full conversation history; the cached state
+        # means only the new message is processed for name, title and tokens
         response = get_llm_response(
             query=message,
             context_chunks=results,
-            conversation_history=messages
+            conversation_history=messages,
+            state=chat_history.get_state(conversation_id, messages)
         )
         
         # Add assistant response
@@ -96,13 +148,35 @@ def chat():
             'conversation_id': conversation_id
         })
         
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected chat request: {str(e)}")
+        return (
+            jsonify({'error': str(e), 'retry_after': e.retry_after}),
+            e.status_code,
+            {'Retry-After': str(e.retry_after)}
+        )
+        
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Return per-tenant ingest and search stats, admission control counters and chat storage tiers."""
+    return jsonify({
+        'tenants': get_tenant_manager().get_stats(),
+        'admission': get_admission_stats(),
+        'chat_history': chat_history.get_stats()
+    })
+
 if __name__ == '__main__':
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    # The debug reloader's parent process only watches the code and restarts the
+    # child it spawns with WERKZEUG_RUN_MAIN set, which is the one serving requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
+    
     # Run the app on 0.0.0.0 to make it accessible from outside the container
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,86 @@
+"""Measure disk usage and read latency of the hot and archived chat history tiers.
+
+Usage:
+    python benchmarks/bench_chat_archive.py [--conversations N] [--turns T] [--compression gzip|zstd]
+
+Synthetic conversations are saved as hot JSON files, timed on read, then
+archived into a compressed segment and timed again.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_history import ChatHistoryManager
+
+PHRASES = [
+    "What is the asking price for the property on Main Street?",
+    "The listing shows three bedrooms, two bathrooms and a detached garage.",
+    "Comparable sales in the neighborhood closed between $410,000 and $455,000.",
+    "Can you summarize the inspection report findings for the roof?",
+    "The appraisal lists an effective date of March 3rd and a final value of $432,000.",
+    "Earnest money must be deposited with the escrow agent within three business days.",
+]
+
+
+def make_messages(rng: random.Random, turns: int) -> list:
+    messages = []
+    for _ in range(turns):
+        messages.append({'role': 'user', 'content': ' '.join(rng.choices(PHRASES, k=2))})
+        messages.append({'role': 'assistant', 'content': ' '.join(rng.choices(PHRASES, k=6))})
+    return messages
+
+
+def time_reads(manager: ChatHistoryManager, ids: list) -> np.ndarray:
+    latencies = []
+    for conversation_id in ids:
+        start = time.perf_counter()
+        manager.get_conversation(conversation_id)
+        latencies.append(time.perf_counter() - start)
+    return np.asarray(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=2000)
+    parser.add_argument('--turns', type=int, default=10)
+    parser.add_argument('--compression', default='gzip')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_chat_")
+    rng = random.Random(0)
+    try:
+        manager = ChatHistoryManager(workdir, compression=args.compression)
+        ids = [f"bench-{i}" for i in range(args.conversations)]
+        for conversation_id in ids:
+            manager.save_conversation(conversation_id, make_messages(rng, args.turns))
+        sample = rng.sample(ids, min(500, len(ids)))
+
+        hot_ms = time_reads(manager, sample)
+        start = time.perf_counter()
+        result = manager.archive_cold_conversations(max_age_seconds=0)
+        archive_seconds = time.perf_counter() - start
+        cold_ms = time_reads(manager, sample)
+        stats = manager.get_stats()['archive']
+
+        print(f"{args.conversations} conversations x {args.turns} turns, {args.compression}")
+        print(f"{'tier':<8} {'disk MB':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        print(f"{'hot':<8} {result['hot_bytes'] / 1e6:>8.2f} "
+              f"{np.percentile(hot_ms, 50):>8.3f} {np.percentile(hot_ms, 99):>8.3f}")
+        print(f"{'archive':<8} {stats['disk_bytes'] / 1e6:>8.2f} "
+              f"{np.percentile(cold_ms, 50):>8.3f} {np.percentile(cold_ms, 99):>8.3f}")
+        print(f"Compaction took {archive_seconds:.2f}s; "
+              f"archive is {100 * stats['disk_bytes'] / max(1, result['hot_bytes']):.1f}% of the hot size")
+        manager.archive.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
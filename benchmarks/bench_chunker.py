@@ -0,0 +1,110 @@
+"""Compare the TokenChunker against the previous two-pass LangChain splitter.
+
+Usage:
+    python benchmarks/bench_chunker.py [pdf_dir] [--repeat N]
+
+Without a PDF directory a synthetic real-estate corpus is generated.
+"""
+import os
+import sys
+import time
+import argparse
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter, CharacterTextSplitter
+from text_chunker import TokenChunker
+
+SENTENCES = [
+    "The subject property is a single-family residence located at 123 Main St.",
+    "Comparable sales within a half-mile radius closed between $410,000 and $455,000.",
+    "The buyer shall deposit earnest money with the escrow agent within three business days.",
+    "Information deemed reliable but not guaranteed and should be independently verified.",
+    "The appraiser inspected the interior and exterior of the property on the effective date.",
+    "Seller agrees to provide a clear title free of all liens and encumbrances at closing.",
+    "Gross rent multiplier analysis indicates a value range consistent with the sales approach.",
+]
+
+
+def legacy_split(text: str, title: str = "") -> list:
+    """The pre-TokenChunker splitter, kept here only for comparison."""
+    section_splitter = RecursiveCharacterTextSplitter(
+        separators=["\n\n", "\n", ". ", " "],
+        chunk_size=1500,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False
+    )
+    sentence_splitter = CharacterTextSplitter(
+        separator=".",
+        chunk_size=500,
+        chunk_overlap=50,
+        length_function=len,
+        is_separator_regex=False
+    )
+    final_chunks = []
+    for chunk in section_splitter.split_text(text):
+        if len(chunk) > 1000 and title:
+            chunk = f"From {title}: {chunk}"
+        if len(chunk) > 1000:
+            final_chunks.extend(sentence_splitter.split_text(chunk))
+        else:
+            final_chunks.append(chunk)
+    return final_chunks
+
+
+def load_corpus(pdf_dir: str = None) -> list:
+    """Return a list of (title, pages) tuples."""
+    if pdf_dir:
+        import fitz
+        corpus = []
+        for filename in sorted(os.listdir(pdf_dir)):
+            if not filename.lower().endswith('.pdf'):
+                continue
+            with fitz.open(os.path.join(pdf_dir, filename)) as doc:
+                pages = [' '.join(doc[i].get_text().split()) for i in range(len(doc))]
+            corpus.append((filename, pages))
+        return corpus
+
+    rng = random.Random(0)
+    return [
+        (f"synthetic_{d}.pdf", [' '.join(rng.choices(SENTENCES, k=60)) for _ in range(12)])
+        for d in range(50)
+    ]
+
+
+def run(label: str, fn, corpus: list, repeat: int, token_counter) -> None:
+    total_bytes = sum(len(' '.join(pages)) for _, pages in corpus)
+    best = float('inf')
+    chunks = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [c for title, pages in corpus for c in fn(title, pages)]
+        best = min(best, time.perf_counter() - start)
+
+    tokens = [token_counter(c) for c in chunks]
+    print(
+        f"{label:<14} {len(chunks):>8} chunks  "
+        f"{total_bytes / best / 1e6:>8.2f} MB/s  "
+        f"avg {sum(tokens) / max(len(tokens), 1):>6.1f} tok  "
+        f"max {max(tokens, default=0):>5} tok"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf_dir', nargs='?', default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.pdf_dir)
+    chunker = TokenChunker()
+
+    print(f"Corpus: {len(corpus)} documents, {sum(len(p) for _, p in corpus)} pages")
+    run("legacy", lambda title, pages: legacy_split(' '.join(pages), title), corpus, args.repeat, chunker.count_tokens)
+    run("token_chunker", lambda title, pages: [c['text'] for c in chunker.split_pages(pages)], corpus, args.repeat, chunker.count_tokens)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Compare FlatVectorStore against Chroma for memory, build time and query latency.
+
+Usage:
+    python benchmarks/bench_vector_index.py [--rows N] [--dim D] [--queries Q]
+
+Each backend runs in its own subprocess so resident memory is measured in
+isolation. Vectors are random unit vectors; recall@k is measured against an
+exact float32 search over the same data.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = [
+    ('chroma', None),
+    ('flat', 'float32'),
+    ('flat', 'float16'),
+    ('flat', 'int8'),
+]
+
+
+def make_data(rows: int, dim: int, queries: int):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((rows, dim), dtype=np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    # Queries near stored rows so the top-k is meaningful
+    picks = rng.integers(0, rows, queries)
+    query_vectors = data[picks] + 0.3 * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim)
+    return data, query_vectors
+
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def dir_mb(path: str) -> float:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+    ) / 1e6
+
+
+class PrecomputedEmbeddings:
+    """Embedding function that returns vectors already attached to the texts."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[int(t)] for t in texts]
+
+    def embed_query(self, text):
+        return self.vectors[int(text)]
+
+
+def run_backend(backend: str, dtype: str, rows: int, dim: int, queries: int, k: int) -> dict:
+    data, query_vectors = make_data(rows, dim, queries)
+    exact = np.argsort(-(query_vectors @ data.T), axis=1)[:, :k]
+    workdir = tempfile.mkdtemp(prefix="bench_index_")
+    base_rss = rss_mb()
+    batch = 5000
+
+    try:
+        if backend == 'chroma':
+            import chromadb
+            client = chromadb.PersistentClient(path=workdir)
+            collection = client.create_collection("bench", metadata={"hnsw:space": "l2"})
+            start = time.perf_counter()
+            for i in range(0, rows, batch):
+                collection.add(
+                    ids=[str(j) for j in range(i, min(i + batch, rows))],
+                    embeddings=data[i:i + batch].tolist(),
+                    documents=[str(j) for j in range(i, min(i + batch, rows))]
+                )
+            build_seconds = time.perf_counter() - start
+
+            def search(q):
+                result = collection.query(query_embeddings=[q.tolist()], n_results=k)
+                return [int(i) for i in result['ids'][0]]
+        else:
+            from flat_index import FlatVectorStore
+            store = FlatVectorStore(workdir, PrecomputedEmbeddings(data), dtype=dtype)
+            start = time.perf_counter()
+            for i in range(0, rows, batch):
+                ids = [str(j) for j in range(i, min(i + batch, rows))]
+                store.add_texts(ids, metadatas=[{} for _ in ids], ids=ids)
+            build_seconds = time.perf_counter() - start
+
+            def search(q):
+                return [int(doc.page_content) for doc, _ in store.similarity_search_by_vector_with_score(q, k=k)]
+
+        latencies = []
+        hits = 0
+        for qi, q in enumerate(query_vectors):
+            start = time.perf_counter()
+            found = search(q)
+            latencies.append(time.perf_counter() - start)
+            hits += len(set(found) & set(exact[qi].tolist()))
+
+        latencies = np.asarray(latencies) * 1000
+        return {
+            'backend': backend if dtype is None else f"{backend}/{dtype}",
+            'build_s': build_seconds,
+            'rss_mb': rss_mb() - base_rss,
+            'disk_mb': dir_mb(workdir),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'recall': hits / (queries * k),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=8)
+    parser.add_argument('--single', nargs=2, metavar=('BACKEND', 'DTYPE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        backend, dtype = args.single
+        result = run_backend(backend, None if dtype == '-' else dtype, args.rows, args.dim, args.queries, args.k)
+        print(json.dumps(result))
+        return
+
+    print(f"{args.rows} rows x {args.dim} dims, {args.queries} queries, k={args.k}")
+    print(f"{'backend':<14} {'build s':>8} {'rss MB':>8} {'disk MB':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall':>7}")
+    for backend, dtype in BACKENDS:
+        proc = subprocess.run(
+            [sys.executable, __file__, '--rows', str(args.rows), '--dim', str(args.dim),
+             '--queries', str(args.queries), '--k', str(args.k), '--single', backend, dtype or '-'],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            print(f"{backend:<14} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr else 'unknown error'}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(
+            f"{r['backend']:<14} {r['build_s']:>8.2f} {r['rss_mb']:>8.1f} {r['disk_mb']:>8.1f} "
+            f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['recall']:>7.3f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
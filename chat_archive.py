@@ -0,0 +1,285 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Iterable
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX platforms: compaction is only serialized in-process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COMPACT_LOCK = ".compact.lock"
+HOT_LOCK = ".hot.lock"
+READ_RETRIES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    conversation_id TEXT PRIMARY KEY,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    raw_size INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    last_updated TEXT,
+    title TEXT,
+    preview TEXT,
+    archived_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_segment ON entries(segment);
+"""
+
+def _compress(codec: str, data: bytes, level: int) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, compresslevel=level)
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class ConversationArchive:
+    def __init__(self, archive_dir: str, compression: str = "gzip", level: int = 6, repack_ratio: float = 0.5):
+        """Cold tier for chat history: append-only compressed segment files plus an offset index.
+
+        Every conversation is compressed on its own and written back to back
+        into a segment, so a read is one seek plus one small decompress. The
+        SQLite index maps conversation ids to (segment, offset, length) and
+        keeps the title and preview for listings. Entries removed on promotion
+        leave dead bytes behind; segments whose live share drops below
+        repack_ratio are rewritten by the next compaction.
+        """
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+        compression = compression.lower()
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed; archiving chat history with gzip")
+            compression = "gzip"
+        if compression not in ("gzip", "zstd"):
+            raise ValueError(f"Unknown archive compression: {compression}")
+        self.compression = compression
+        self.level = level
+        self.repack_ratio = repack_ratio
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(archive_dir, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _segment_path(self, segment: str) -> str:
+        return os.path.join(self.archive_dir, segment)
+
+    def _next_segment(self) -> str:
+        existing = [name for name in os.listdir(self.archive_dir) if name.startswith("segment_")]
+        numbers = [int(name.split('_')[1].split('.')[0]) for name in existing]
+        return f"segment_{(max(numbers) + 1 if numbers else 1):06d}.seg"
+
+    def interprocess_lock(self, name: str = COMPACT_LOCK, shared: bool = False, blocking: bool = False):
+        """Open and flock a lock file in the archive directory.
+
+        Returns the open handle (close it to release), or None if blocking is
+        False and another process holds a conflicting lock. COMPACT_LOCK keeps
+        compactions exclusive; HOT_LOCK is taken shared by saves and exclusively
+        while compaction deletes hot files.
+        """
+        handle = open(os.path.join(self.archive_dir, name), 'w')
+        if fcntl is not None:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            try:
+                fcntl.flock(handle, flags if blocking else flags | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return None
+        return handle
+
+    def get(self, conversation_id: str) -> Optional[Dict]:
+        """Read one archived conversation, or None if it is not in the archive.
+
+        The offset is looked up and read under the lock, so an in-process
+        repack cannot remove the segment in between. A repack in another
+        process can; the lookup is then retried against the updated index.
+        Read errors are raised, never reported as a missing conversation.
+        """
+        with self._lock:
+            for attempt in range(READ_RETRIES):
+                row = self._conn.execute(
+                    "SELECT segment, offset, length, codec FROM entries WHERE conversation_id = ?",
+                    (conversation_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                segment, offset, length, codec = row
+                try:
+                    with open(self._segment_path(segment), 'rb') as f:
+                        f.seek(offset)
+                        payload = f.read(length)
+                    return json.loads(_decompress(codec, payload).decode('utf-8'))
+                except FileNotFoundError:
+                    if attempt == READ_RETRIES - 1:
+                        raise
+                    # Pick up the index commit of a repack that just finished
+                    self._conn.commit()
+                    time.sleep(0.05 * (attempt + 1))
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM entries WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone() is not None
+
+    def remove(self, conversation_id: str) -> bool:
+        """Drop a conversation from the index; its bytes are reclaimed on repack."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM entries WHERE conversation_id = ?", (conversation_id,))
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def list_entries(self) -> List[Dict]:
+        """Listing metadata for every archived conversation, without decompressing anything."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT conversation_id, last_updated, title, preview FROM entries"
+            ).fetchall()
+        return [
+            {'conversation_id': cid, 'last_updated': updated, 'title': title, 'preview': preview, 'archived': True}
+            for cid, updated, title, preview in rows
+        ]
+
+    def _tmp_segment_path(self) -> str:
+        return self._segment_path(f".segment.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    def _install_segment(self, tmp_path: str) -> str:
+        """Rename a fsynced temporary segment to the next segment name. Call with the lock held."""
+        segment = self._next_segment()
+        os.rename(tmp_path, self._segment_path(segment))
+        return segment
+
+    def write_segment(self, conversations: Iterable[Dict[str, Any]]) -> int:
+        """Append conversations to a new segment and index them.
+
+        Each item holds the conversation 'data' plus 'preview'. Compression and
+        the fsync happen without the lock, so reads and removals carry on; the
+        lock is only held to rename the segment into place and commit the
+        index, so a crash never leaves index rows pointing at missing bytes.
+        """
+        tmp_path = self._tmp_segment_path()
+        rows = []
+        offset = 0
+        with open(tmp_path, 'wb') as f:
+            for item in conversations:
+                data = item['data']
+                raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                payload = _compress(self.compression, raw, self.level)
+                f.write(payload)
+                rows.append((
+                    data['conversation_id'], offset, len(payload), item.get('raw_size', len(raw)),
+                    self.compression, data.get('last_updated'), data.get('title'), item.get('preview'),
+                    time.time()
+                ))
+                offset += len(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if not rows:
+            os.remove(tmp_path)
+            return 0
+
+        with self._lock:
+            segment = self._install_segment(tmp_path)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (conversation_id, segment, offset, length, raw_size, codec, "
+                "last_updated, title, preview, archived_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row[0], segment, *row[1:]) for row in rows]
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def repack(self) -> int:
+        """Rewrite segments that are mostly dead bytes; returns the number of segments removed.
+
+        Live payloads are copied as compressed bytes without the lock. Only
+        entries still at their old position are re-pointed at commit, so a
+        conversation removed or re-archived meanwhile keeps its newer state.
+        Segments are only ever written by the process holding COMPACT_LOCK.
+        """
+        with self._lock:
+            live = dict(self._conn.execute("SELECT segment, SUM(length) FROM entries GROUP BY segment").fetchall())
+            sparse = []
+            for name in os.listdir(self.archive_dir):
+                if not name.startswith("segment_"):
+                    continue
+                size = os.path.getsize(self._segment_path(name))
+                if size and live.get(name, 0) / size < self.repack_ratio:
+                    sparse.append(name)
+            if not sparse:
+                return 0
+            placeholders = ','.join('?' * len(sparse))
+            entries = self._conn.execute(
+                f"SELECT conversation_id, segment, offset, length FROM entries WHERE segment IN ({placeholders}) "
+                "ORDER BY segment, offset", sparse
+            ).fetchall()
+
+        tmp_path = self._tmp_segment_path()
+        moves = []
+        new_offset = 0
+        with open(tmp_path, 'wb') as out:
+            for segment in sparse:
+                with open(self._segment_path(segment), 'rb') as f:
+                    for conversation_id, entry_segment, offset, length in entries:
+                        if entry_segment != segment:
+                            continue
+                        f.seek(offset)
+                        out.write(f.read(length))
+                        moves.append((new_offset, conversation_id, segment, offset))
+                        new_offset += length
+            out.flush()
+            os.fsync(out.fileno())
+
+        with self._lock:
+            if moves:
+                new_segment = self._install_segment(tmp_path)
+                self._conn.executemany(
+                    "UPDATE entries SET segment = ?, offset = ? WHERE conversation_id = ? AND segment = ? AND offset = ?",
+                    [(new_segment, new_offset, cid, segment, offset) for new_offset, cid, segment, offset in moves]
+                )
+                self._conn.commit()
+            else:
+                os.remove(tmp_path)
+            # get() reads under the lock, so no reader is still using an old offset
+            for segment in sparse:
+                os.remove(self._segment_path(segment))
+        return len(sparse)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Entry count, on-disk bytes and the uncompressed size they stand for."""
+        with self._lock:
+            count, live_bytes, raw_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0), COALESCE(SUM(raw_size), 0) FROM entries"
+            ).fetchone()
+        disk_bytes = sum(
+            os.path.getsize(self._segment_path(name))
+            for name in os.listdir(self.archive_dir) if name.startswith("segment_")
+        )
+        return {
+            'conversations': count,
+            'disk_bytes': disk_bytes,
+            'live_bytes': live_bytes,
+            'raw_bytes': raw_bytes,
+            'compression': self.compression
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
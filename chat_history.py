@@ -1,41 +1,122 @@
 import json
 import os
+import time
+import threading
 from datetime import datetime
 import logging
-from typing import List, Dict
+from collections import OrderedDict
+from typing import List, Dict, Any
+from chat_archive import ConversationArchive, HOT_LOCK
+from conversation_state import ConversationState
 
 logger = logging.getLogger(__name__)
 
 class ChatHistoryManager:
-    def __init__(self, history_dir="chat_history"):
-        """Initialize chat history manager."""
+    def __init__(self, history_dir="chat_history", archive_after_days=None, compression=None):
+        """Initialize chat history manager.
+        
+        Conversations live as JSON files in history_dir (the hot tier) until
+        they go untouched for archive_after_days (CHAT_ARCHIVE_AFTER_DAYS,
+        default 30); archive_cold_conversations then moves them into
+        compressed segments under history_dir/archive (the cold tier).
+        Archived conversations are read transparently and promoted back to a
+        hot file the next time they are saved.
+        """
         self.history_dir = history_dir
         os.makedirs(history_dir, exist_ok=True)
+        if archive_after_days is None:
+            archive_after_days = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "30"))
+        self.archive_after_seconds = archive_after_days * 86400
+        self.archive = ConversationArchive(
+            os.path.join(history_dir, "archive"),
+            compression=compression or os.getenv("CHAT_ARCHIVE_COMPRESSION", "gzip")
+        )
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._archiver = None
+        
+        # Derived per-conversation state (name, title, token counts, built
+        # messages), LRU-bounded; persisted copies live in each conversation
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self.max_cached_states = int(os.getenv("CHAT_STATE_CACHE_SIZE", "1024"))
+        
+        # Per-tier read counters, plus compaction totals
+        self.stats = {
+            'hot_reads': 0,
+            'hot_read_seconds': 0.0,
+            'archive_reads': 0,
+            'archive_read_seconds': 0.0,
+            'archived': 0,
+            'promoted': 0
+        }
+    
+    def _conversation_path(self, conversation_id: str) -> str:
+        return os.path.join(self.history_dir, f"conversation_{conversation_id}.json")
+    
+    def _cache_state(self, conversation_id: str, state: ConversationState) -> ConversationState:
+        with self._lock:
+            self._states[conversation_id] = state
+            self._states.move_to_end(conversation_id)
+            while len(self._states) > self.max_cached_states:
+                self._states.popitem(last=False)
+            return state
+    
+    def _seed_state(self, conversation_id: str, conversation: Dict) -> None:
+        """Cache the persisted state record of a conversation just read, unless one is cached."""
+        with self._lock:
+            if conversation_id not in self._states and conversation.get('state'):
+                self._cache_state(conversation_id, ConversationState(conversation['state']))
+    
+    def get_state(self, conversation_id: str, messages: List[Dict]) -> ConversationState:
+        """Return the conversation's derived state, brought up to date with messages.
+        
+        Only messages appended since the state was last synced are processed.
+        A state not cached yet is seeded from the record persisted with the
+        conversation, if there is one.
+        """
+        with self._lock:
+            state = self._states.get(conversation_id)
+        if state is None:
+            conversation = self.get_conversation(conversation_id) or {}
+            with self._lock:
+                state = self._states.get(conversation_id) or ConversationState(conversation.get('state'))
+        self._cache_state(conversation_id, state)
+        return state.sync(messages)
     
     def save_conversation(self, conversation_id: str, messages: List[Dict]) -> bool:
-        """Save a conversation thread to a JSON file."""
+        """Save a conversation thread to a JSON file, promoting it out of the archive if needed."""
         try:
             # Create a unique filename for the conversation
-            filename = os.path.join(self.history_dir, f"conversation_{conversation_id}.json")
-            
-            # Get existing conversation if it exists
-            existing_messages = []
-            if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    existing_messages = data.get('messages', [])
+            filename = self._conversation_path(conversation_id)
             
-            # Update conversation data
+            # Update conversation data; the title comes from the incrementally kept state
+            state = self.get_state(conversation_id, messages)
             conversation_data = {
                 "conversation_id": conversation_id,
                 "last_updated": datetime.now().isoformat(),
                 "messages": messages,
-                "title": self._generate_title(messages)
+                "title": state.title,
+                "state": state.to_dict()
             }
             
-            # Save to file
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(conversation_data, f, indent=2, ensure_ascii=False)
+            # Shared with other savers, exclusive with compaction deleting hot
+            # files, so a save in any worker can't be removed as cold. Taken
+            # before the thread lock, in the same order as compaction.
+            hot_lock = self.archive.interprocess_lock(HOT_LOCK, shared=True, blocking=True)
+            try:
+                with self._lock:
+                    # Save to file; replaced atomically so readers never see a partial write
+                    tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp_filename, 'w', encoding='utf-8') as f:
+                        json.dump(conversation_data, f, indent=2, ensure_ascii=False)
+                    os.replace(tmp_filename, filename)
+                    
+                    # The hot file is now authoritative; drop the archived copy
+                    if self.archive.remove(conversation_id):
+                        self.stats['promoted'] += 1
+                        logger.info(f"Promoted conversation {conversation_id} back from the archive")
+            finally:
+                hot_lock.close()
             
             logger.info(f"Conversation saved to {filename}")
             return True
@@ -45,19 +126,40 @@ class ChatHistoryManager:
             return False
     
     def get_conversation(self, conversation_id: str) -> Dict:
-        """Get a specific conversation by ID."""
+        """Get a specific conversation by ID from whichever tier holds it.
+        
+        Returns None only if the conversation exists in neither tier; read
+        errors are raised so callers never mistake them for a new conversation.
+        """
         try:
-            filename = os.path.join(self.history_dir, f"conversation_{conversation_id}.json")
-            if os.path.exists(filename):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return None
+            started = time.perf_counter()
+            try:
+                with open(self._conversation_path(conversation_id), 'r', encoding='utf-8') as f:
+                    conversation = json.load(f)
+                self.stats['hot_reads'] += 1
+                self.stats['hot_read_seconds'] += time.perf_counter() - started
+                self._seed_state(conversation_id, conversation)
+                return conversation
+            except FileNotFoundError:
+                pass
+            
+            conversation = self.archive.get(conversation_id)
+            if conversation is not None:
+                self.stats['archive_reads'] += 1
+                self.stats['archive_read_seconds'] += time.perf_counter() - started
+                self._seed_state(conversation_id, conversation)
+            return conversation
         except Exception as e:
             logger.error(f"Error getting conversation {conversation_id}: {str(e)}")
-            return None
+            raise
     
     def get_all_conversations(self) -> List[Dict]:
-        """Get all conversations with their metadata."""
+        """Get all conversations with their metadata.
+        
+        Archived conversations are listed from the archive index (id, title,
+        last_updated, preview, archived=True) without their messages; use
+        get_conversation to load one.
+        """
         try:
             conversations = []
             for file in os.listdir(self.history_dir):
@@ -69,6 +171,12 @@ class ChatHistoryManager:
                         conversation['preview'] = self._generate_preview(conversation['messages'])
                         conversations.append(conversation)
             
+            # A conversation can briefly exist in both tiers mid-compaction; the hot copy wins
+            hot_ids = {c.get('conversation_id') for c in conversations}
+            conversations.extend(
+                entry for entry in self.archive.list_entries() if entry['conversation_id'] not in hot_ids
+            )
+            
             # Sort by last updated time, newest first
             return sorted(
                 conversations,
@@ -81,37 +189,158 @@ class ChatHistoryManager:
             return []
     
     def delete_conversation(self, conversation_id: str) -> None:
-        """Delete a conversation by its ID."""
+        """Delete a conversation by its ID from both tiers."""
         try:
             # Get the conversation file path
-            conversation_file = os.path.join(self.history_dir, f"conversation_{conversation_id}.json")
+            conversation_file = self._conversation_path(conversation_id)
             
-            # Check if file exists
-            if not os.path.exists(conversation_file):
-                raise FileNotFoundError(f"Conversation {conversation_id} not found")
+            with self._lock:
+                self._states.pop(conversation_id, None)
+                archived = self.archive.remove(conversation_id)
                 
-            # Delete the file
-            os.remove(conversation_file)
+                # Check if it exists in either tier
+                if not os.path.exists(conversation_file):
+                    if archived:
+                        logger.info(f"Deleted archived conversation {conversation_id}")
+                        return
+                    raise FileNotFoundError(f"Conversation {conversation_id} not found")
+                    
+                # Delete the file
+                os.remove(conversation_file)
             logger.info(f"Deleted conversation {conversation_id}")
             
         except Exception as e:
             logger.error(f"Error deleting conversation {conversation_id}: {str(e)}")
             raise
     
-    def _generate_title(self, messages: List[Dict]) -> str:
-        """Generate a title for the conversation based on the first user message."""
+    def archive_cold_conversations(self, max_age_seconds: float = None) -> Dict[str, Any]:
+        """Move conversations untouched for max_age_seconds into a new compressed segment.
+        
+        Age is the hot file's mtime, so nothing is parsed to find candidates.
+        Only one process compacts at a time; others return immediately.
+        Reading, compressing and writing the segment run without the manager
+        lock, so saves and reads in this process carry on. Hot files are then
+        deleted under the exclusive HOT_LOCK, which saves in every worker take
+        shared, and only if unchanged since they were read, so a concurrent
+        save is never deleted.
+        """
+        max_age_seconds = self.archive_after_seconds if max_age_seconds is None else max_age_seconds
+        cutoff = time.time() - max_age_seconds
+        lock_handle = self.archive.interprocess_lock(blocking=False)
+        if lock_handle is None:
+            return {'archived': 0, 'hot_bytes': 0, 'archive_bytes': 0, 'skipped': True}
+        
         try:
-            for msg in messages:
-                if msg['role'] == 'user':
-                    # Take first 50 chars of first user message
-                    title = msg['content'][:50]
-                    if len(msg['content']) > 50:
-                        title += '...'
-                    return title
-            return "New Conversation"
-        except Exception as e:
-            logger.error(f"Error generating title: {str(e)}")
-            return "New Conversation"
+            # Hot files are replaced atomically, so they can be read without the lock
+            cold = []
+            for file in os.listdir(self.history_dir):
+                if not (file.startswith('conversation_') and file.endswith('.json')):
+                    continue
+                filepath = os.path.join(self.history_dir, file)
+                try:
+                    stat = os.stat(filepath)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Skipping {file} during archival: {str(e)}")
+                    continue
+                cold.append((filepath, stat, {
+                    'data': data,
+                    'raw_size': stat.st_size,
+                    'preview': self._generate_preview(data.get('messages', []))
+                }))
+            
+            if not cold:
+                return {'archived': 0, 'hot_bytes': 0, 'archive_bytes': 0}
+            
+            before = self.archive.get_stats()['disk_bytes']
+            archived = self.archive.write_segment(item for _, _, item in cold)
+            added = self.archive.get_stats()['disk_bytes'] - before
+            
+            # Only after the index commit, and with every worker's saves held off:
+            # remove hot files not rewritten meanwhile. Rewritten ones stay hot and
+            # lose the archived copy just made of their older version.
+            hot_lock = self.archive.interprocess_lock(HOT_LOCK, blocking=True)
+            try:
+                with self._lock:
+                    for filepath, stat, item in cold:
+                        try:
+                            current = os.stat(filepath)
+                        except FileNotFoundError:
+                            continue
+                        if (current.st_mtime_ns, current.st_size) == (stat.st_mtime_ns, stat.st_size):
+                            os.remove(filepath)
+                        else:
+                            self.archive.remove(item['data']['conversation_id'])
+            finally:
+                hot_lock.close()
+            
+            self.archive.repack()
+            with self._lock:
+                self.stats['archived'] += archived
+            hot_bytes = sum(stat.st_size for _, stat, _ in cold)
+            logger.info(
+                f"Archived {archived} conversations: {hot_bytes} bytes of JSON into {added} compressed bytes"
+            )
+            return {'archived': archived, 'hot_bytes': hot_bytes, 'archive_bytes': added}
+        finally:
+            lock_handle.close()
+    
+    def start_archiver(self, interval: float = None) -> None:
+        """Run archive_cold_conversations every interval seconds (CHAT_ARCHIVE_INTERVAL, default 3600)."""
+        if self._archiver is not None:
+            return
+        interval = float(os.getenv("CHAT_ARCHIVE_INTERVAL", "3600")) if interval is None else interval
+        
+        def run():
+            while not self._stop_event.is_set():
+                try:
+                    self.archive_cold_conversations()
+                except Exception as e:
+                    logger.error(f"Error archiving conversations: {str(e)}")
+                self._stop_event.wait(interval)
+        
+        self._stop_event.clear()
+        self._archiver = threading.Thread(target=run, name="chat-archiver", daemon=True)
+        self._archiver.start()
+    
+    def stop_archiver(self) -> None:
+        """Stop the background archiver thread."""
+        self._stop_event.set()
+        if self._archiver is not None:
+            self._archiver.join(timeout=5)
+            self._archiver = None
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-tier conversation counts, disk usage and average read latency."""
+        hot_files = [
+            os.path.join(self.history_dir, file) for file in os.listdir(self.history_dir)
+            if file.startswith('conversation_') and file.endswith('.json')
+        ]
+        archive = self.archive.get_stats()
+        return {
+            'hot': {
+                'conversations': len(hot_files),
+                'disk_bytes': sum(os.path.getsize(path) for path in hot_files),
+                'reads': self.stats['hot_reads'],
+                'avg_read_ms': (
+                    1000 * self.stats['hot_read_seconds'] / self.stats['hot_reads'] if self.stats['hot_reads'] else 0.0
+                )
+            },
+            'archive': {
+                **archive,
+                'saved_bytes': archive['raw_bytes'] - archive['live_bytes'],
+                'reads': self.stats['archive_reads'],
+                'avg_read_ms': (
+                    1000 * self.stats['archive_read_seconds'] / self.stats['archive_reads']
+                    if self.stats['archive_reads'] else 0.0
+                )
+            },
+            'archived': self.stats['archived'],
+            'promoted': self.stats['promoted']
+        }
     
     def _generate_preview(self, messages: List[Dict]) -> str:
         """Generate a preview of the conversation."""
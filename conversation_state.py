@@ -0,0 +1,174 @@
+import re
+import hashlib
+import logging
+import threading
+import tiktoken
+from typing import List, Dict, Any, Callable, Optional
+
+# What a buyer or renter profile is made of: property types, features, areas and prices
+PROFILE_TERMS = (
+    r"(?:houses?|homes?|condos?|apartments?|townhouses?|townhomes?|duplex(?:es)?|propert(?:y|ies)|lots?|land|acres?"
+    r"|bed(?:room)?s?|bath(?:room)?s?|garage|yard|pool|neighbou?rhoods?|school district|suburbs?|downtown"
+    r"|\$\s?\d[\d,.]*k?)\b"
+    # "a home inspection" or "the house price" is about a document, not a wish
+    r"(?!\s+(?:inspection|appraisal|report|tax(?:es)?|insurance|loan|application|agreement|contract|lease"
+    r"|listing|value|price|deed|title|documents?|paperwork|summary|details|address)\b)"
+)
+# Up to three describing words before the term; never a determiner or a
+# preposition, so "the property tax" and "a copy of the lease" don't qualify
+MODIFIERS = (
+    r"(?:(?!(?:of|for|about|on|regarding|to|with|from|the|my|this|that|these|those|your|our|their|his|her|its)\b)"
+    r"[\w$,'-]+\s+){0,3}"
+)
+QUANTITY = r"(?:a|an|some|at least|under|below|less than|no more than|around|about|\d+)\s+"
+# "I want a 3-bedroom house", "I'd like to buy a home under $400k", "I want something under $500k"
+WANT_OBJECT = (
+    r"(?=\s+(?:to (?:buy|rent|lease|find|live|move|relocate|invest)\s+(?:(?:in|near|close to|around|into)\s+)?)?"
+    r"(?:(?:something|anything|one)\s+)?" + QUANTITY + MODIFIERS + PROFILE_TERMS + r")"
+)
+# "I need" is usually a request ("I need the property tax amount"); only "I need a/an/some ..." counts
+NEED_OBJECT = r"(?=\s+(?:a|an|some)\s+" + MODIFIERS + PROFILE_TERMS + r")"
+# "I'm looking for a condo near downtown", "I'm interested in rental properties"
+SEARCH_OBJECT = r"(?=\s+(?:" + QUANTITY + r")?" + MODIFIERS + PROFILE_TERMS + r")"
+# Statements worth carrying into every prompt: preferences and the buyer or renter profile
+PREFERENCE_PATTERN = re.compile(
+    r"\b(?:(?:i|we)(?: would|'d)? prefer|my (?:budget|price range|max(?:imum)? budget) is"
+    r"|(?:i(?: am|'m)|we(?: are|'re)) (?:moving|relocating) to"
+    r"|(?:(?:i|we) (?:want|would like)|(?:i|we)'d like)" + WANT_OBJECT +
+    r"|(?:i|we) need" + NEED_OBJECT +
+    r"|(?:i(?: am|'m)|we(?: are|'re)) (?:looking|searching|shopping) for" + SEARCH_OBJECT +
+    r"|(?:i(?: am|'m)|we(?: are|'re)) interested in" + SEARCH_OBJECT +
+    r")\b[^.!?\n]{3,120}",
+    re.IGNORECASE
+)
+MAX_PREFERENCES = 5
+# Bump when derivation rules change so stored records are rebuilt from the messages
+STATE_VERSION = 3
+DEFAULT_TITLE = "New Conversation"
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """Count cl100k_base tokens, falling back to a 4-characters-per-token estimate."""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Don't retry the download on every message
+            logger.warning(f"Token counting falls back to an estimate: {str(e)}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode_ordinary(text))
+    return max(1, len(text) // 4) if text else 0
+
+def extract_user_name(content: str) -> Optional[str]:
+    """Find a self-introduced name ("my name is ...", "i am ...") in a user message."""
+    content = content.lower()
+    try:
+        if "my name is " in content:
+            return content.split("my name is ")[1].split()[0].title()
+        elif "i am " in content or "i'm " in content:
+            after_am = content.split("i am " if "i am " in content else "i'm ")[1].split()[0].title()
+            if len(after_am) > 2:  # Basic check to avoid "I am a..." cases
+                return after_am
+    except IndexError:
+        pass
+    return None
+
+def _fingerprint(message: Dict) -> str:
+    return hashlib.md5(f"{message.get('role')}\x00{message.get('content', '')}".encode('utf-8')).hexdigest()
+
+class ConversationState:
+    def __init__(self, record: Dict[str, Any] = None):
+        """Derived state of a conversation, kept current one appended message at a time.
+
+        The record (see to_dict) is persisted alongside the messages. It tracks
+        how many messages were folded in and a fingerprint of the last one, so
+        sync() only processes new messages and starts over if the stored
+        history was edited or truncated. history_digest is a hash chained over
+        every message and identifies the full history in O(1).
+        """
+        self._lock = threading.RLock()
+        record = record or {}
+        self._load(record if record.get('version') == STATE_VERSION else {})
+
+    def _load(self, record: Dict[str, Any]) -> None:
+        self.message_count = record.get('message_count', 0)
+        self.last_fingerprint = record.get('last_fingerprint')
+        self.history_digest = record.get('history_digest', '')
+        self.user_name = record.get('user_name')
+        self.preferences: List[str] = list(record.get('preferences', []))
+        self.title = record.get('title', DEFAULT_TITLE)
+        self.has_title = record.get('has_title', False)
+        self.token_counts: Dict[str, int] = dict(record.get('token_counts', {}))
+        # Pre-built message objects (not persisted), aligned with the messages folded in
+        self._built: List[Any] = []
+        self._built_count = 0
+
+    def _append(self, message: Dict) -> None:
+        role = message.get('role')
+        content = message.get('content', '') or ''
+        fingerprint = _fingerprint(message)
+
+        if role == 'user':
+            if self.user_name is None:
+                self.user_name = extract_user_name(content)
+            if not self.has_title:
+                self.title = content[:50] + ('...' if len(content) > 50 else '')
+                self.has_title = True
+            for match in PREFERENCE_PATTERN.finditer(content):
+                preference = ' '.join(match.group(0).split())
+                if preference not in self.preferences:
+                    self.preferences = (self.preferences + [preference])[-MAX_PREFERENCES:]
+
+        self.token_counts[role] = self.token_counts.get(role, 0) + count_tokens(content)
+        self.history_digest = hashlib.sha256(f"{self.history_digest}{fingerprint}".encode()).hexdigest()
+        self.last_fingerprint = fingerprint
+        self.message_count += 1
+
+    def sync(self, messages: List[Dict]) -> "ConversationState":
+        """Fold in messages not seen yet; rebuilds from scratch if the history diverged."""
+        with self._lock:
+            n = self.message_count
+            if n > len(messages) or (n and _fingerprint(messages[n - 1]) != self.last_fingerprint):
+                self._load({})
+                n = 0
+            for message in messages[n:]:
+                self._append(message)
+            return self
+
+    def history_messages(self, messages: List[Dict], factory: Callable[[Dict], Any]) -> List[Any]:
+        """Return factory(message) for every message, building only the ones not cached yet.
+
+        factory may return None for messages that should be left out.
+        """
+        with self._lock:
+            self.sync(messages)
+            for message in messages[self._built_count:self.message_count]:
+                built = factory(message)
+                if built is not None:
+                    self._built.append(built)
+            self._built_count = self.message_count
+            return list(self._built)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.token_counts.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Persistable record of the derived state."""
+        with self._lock:
+            return {
+                'version': STATE_VERSION,
+                'message_count': self.message_count,
+                'last_fingerprint': self.last_fingerprint,
+                'history_digest': self.history_digest,
+                'user_name': self.user_name,
+                'preferences': list(self.preferences),
+                'title': self.title,
+                'has_title': self.has_title,
+                'token_counts': dict(self.token_counts)
+            }
@@ -0,0 +1,288 @@
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+# Mersenne prime for the universal hash family; 32-bit inputs keep a*x+b inside uint64
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Tokens that carry the facts of templated documents: amounts, percentages,
+# dates, numbers and month names. Near-duplicates must agree on all of them.
+FACT_PATTERN = re.compile(
+    r'[$€£]?\d[\d,]*(?:\.\d+)?%?(?:[/-]\d+)*'
+    r'|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b',
+    re.IGNORECASE
+)
+
+def normalize_text(text: str) -> str:
+    """Lowercased words joined by single spaces."""
+    return ' '.join(WORD_PATTERN.findall(text.lower()))
+
+def fact_tokens(text: str) -> List[str]:
+    """Number, currency and date tokens in order of appearance."""
+    return [token.lower().replace(',', '') for token in FACT_PATTERN.findall(text)]
+
+def _digest(value: str) -> str:
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()
+
+def same_facts(a: str, b: str) -> bool:
+    """True if two texts are identical after normalization or share every fact token."""
+    return normalize_text(a) == normalize_text(b) or fact_tokens(a) == fact_tokens(b)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    chunk_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    text_hash TEXT,
+    facts_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_owner ON chunks(owner);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    chunk_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bands_bucket ON bands(band, bucket);
+CREATE INDEX IF NOT EXISTS idx_bands_chunk ON bands(chunk_id);
+CREATE TABLE IF NOT EXISTS refs (
+    chunk_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    page INTEGER,
+    page_end INTEGER,
+    PRIMARY KEY (chunk_id, source, page)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_source ON refs(source);
+"""
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """MinHash signatures over word shingles, vectorized across permutations."""
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, (1 << 32) - 1, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, (1 << 32) - 1, size=num_perm, dtype=np.uint64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        words = WORD_PATTERN.findall(text.lower())
+        if len(words) < self.shingle_size:
+            grams = [' '.join(words)]
+        else:
+            grams = {' '.join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        return np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Return a uint32 signature of length num_perm."""
+        shingles = self._shingles(text)
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) % MERSENNE_PRIME
+        return (hashed & MAX_HASH).min(axis=1).astype(np.uint32)
+
+def jaccard_estimate(a: np.ndarray, b: np.ndarray) -> float:
+    """Fraction of matching MinHash slots, an estimate of Jaccard similarity."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+def dedupe_results(results: List[Dict[str, Any]], hasher: "MinHasher" = None, threshold: float = 0.8) -> List[Dict[str, Any]]:
+    """Drop search results that are near-copies of a higher-ranked result.
+
+    Similar results that differ in any number, amount or date are kept, since
+    templated documents differ exactly there.
+    """
+    hasher = hasher or MinHasher()
+    kept, seen = [], []
+    for result in results:
+        content = result.get('content', '') or result.get('page_content', '')
+        signature = hasher.signature(content)
+        if any(
+            jaccard_estimate(signature, other) >= threshold and same_facts(content, other_content)
+            for other, other_content in seen
+        ):
+            continue
+        kept.append(result)
+        seen.append((signature, content))
+    return kept
+
+class NearDuplicateIndex:
+    def __init__(self, db_path: str, num_perm: int = 128, bands: int = 16, threshold: float = 0.8):
+        """Corpus-wide LSH index of canonical chunks plus references from duplicate sources.
+
+        Signatures are split into bands; chunks sharing any band bucket are
+        candidates and are confirmed by estimated Jaccard >= threshold. With
+        16 bands of 8 rows the candidate curve rises around 0.7 similarity.
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.hasher = MinHasher(num_perm=num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # Indexes created before fact checking lack these columns; their rows never match
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        for column in ('text_hash', 'facts_hash'):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE chunks ADD COLUMN {column} TEXT")
+        if 'page_end' not in {row[1] for row in self._conn.execute("PRAGMA table_info(refs)")}:
+            self._conn.execute("ALTER TABLE refs ADD COLUMN page_end INTEGER")
+        self._conn.commit()
+
+    def _buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        buckets = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, 'little', signed=True)))
+        return buckets
+
+    def find_duplicate(self, signature: np.ndarray, text: str) -> Optional[str]:
+        """Return the canonical chunk id text duplicates, if any.
+
+        LSH candidates must reach the Jaccard threshold and then either be
+        identical after normalization or carry exactly the same number,
+        currency and date tokens. Two contracts from one template that differ
+        only in price are therefore both stored.
+        """
+        text_hash = _digest(normalize_text(text))
+        facts_hash = _digest('\x00'.join(fact_tokens(text)))
+        with self._lock:
+            candidates = set()
+            for band, bucket in self._buckets(signature):
+                rows = self._conn.execute(
+                    "SELECT chunk_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+                ).fetchall()
+                candidates.update(row[0] for row in rows)
+
+            best_id, best_score = None, self.threshold
+            for chunk_id in candidates:
+                row = self._conn.execute(
+                    "SELECT signature, text_hash, facts_hash FROM chunks WHERE chunk_id = ?", (chunk_id,)
+                ).fetchone()
+                if row is None or (row[1] != text_hash and row[2] != facts_hash):
+                    continue
+                score = jaccard_estimate(signature, np.frombuffer(row[0], dtype=np.uint32))
+                if score >= best_score:
+                    best_id, best_score = chunk_id, score
+            return best_id
+
+    def add_canonical(self, chunk_id: str, owner: str, signature: np.ndarray, text: str) -> None:
+        """Register a chunk that is stored in the vector store."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (chunk_id, owner, signature, text_hash, facts_hash) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chunk_id, owner, signature.astype(np.uint32).tobytes(),
+                 _digest(normalize_text(text)), _digest('\x00'.join(fact_tokens(text))))
+            )
+            self._conn.execute("DELETE FROM bands WHERE chunk_id = ?", (chunk_id,))
+            self._conn.executemany(
+                "INSERT INTO bands (band, bucket, chunk_id) VALUES (?, ?, ?)",
+                [(band, bucket, chunk_id) for band, bucket in self._buckets(signature)]
+            )
+
+    def add_reference(self, chunk_id: str, source: str, page: int, page_end: int = None) -> None:
+        """Record that source contains a near-copy of a canonical chunk on pages page..page_end."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO refs (chunk_id, source, page, page_end) VALUES (?, ?, ?, ?)",
+                (chunk_id, source, page, page if page_end is None else page_end)
+            )
+
+    def references_by_source(self, sources: List[str] = None) -> Dict[str, List[List[Any]]]:
+        """Map each source (all sources if None) to [chunk id, page, page_end] of the chunks it references."""
+        with self._lock:
+            if sources is None:
+                rows = self._conn.execute("SELECT source, chunk_id, page, page_end FROM refs").fetchall()
+            elif not sources:
+                return {}
+            else:
+                placeholders = ','.join('?' * len(sources))
+                rows = self._conn.execute(
+                    f"SELECT source, chunk_id, page, page_end FROM refs WHERE source IN ({placeholders})",
+                    list(sources)
+                ).fetchall()
+        refs: Dict[str, List[List[Any]]] = {}
+        for source, chunk_id, page, page_end in rows:
+            refs.setdefault(source, []).append([chunk_id, page, page if page_end is None else page_end])
+        return refs
+
+    def references(self, chunk_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Map canonical chunk ids to the other sources that reference them."""
+        if not chunk_ids:
+            return {}
+        with self._lock:
+            placeholders = ','.join('?' * len(chunk_ids))
+            rows = self._conn.execute(
+                f"SELECT chunk_id, source, page FROM refs WHERE chunk_id IN ({placeholders})", list(chunk_ids)
+            ).fetchall()
+        refs: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk_id, source, page in rows:
+            refs.setdefault(chunk_id, []).append({'source': source, 'page': page})
+        return refs
+
+    def release_source(self, source: str) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+        """Detach a source from the index.
+
+        Returns (chunk ids to delete, {chunk id: new owner reference}) for the
+        canonical chunks it owned. A chunk still referenced elsewhere is handed
+        to one of those references instead of being deleted.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM refs WHERE source = ?", (source,))
+            owned = [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks WHERE owner = ?", (source,))]
+            to_delete, promoted = [], {}
+            for chunk_id in owned:
+                heir = self._conn.execute(
+                    "SELECT source, page FROM refs WHERE chunk_id = ? ORDER BY source, page LIMIT 1", (chunk_id,)
+                ).fetchone()
+                if heir is None:
+                    to_delete.append(chunk_id)
+                    self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+                    self._conn.execute("DELETE FROM bands WHERE chunk_id = ?", (chunk_id,))
+                else:
+                    self._conn.execute("UPDATE chunks SET owner = ? WHERE chunk_id = ?", (heir[0], chunk_id))
+                    self._conn.execute(
+                        "DELETE FROM refs WHERE chunk_id = ? AND source = ? AND page IS ?", (chunk_id, heir[0], heir[1])
+                    )
+                    promoted[chunk_id] = {'source': heir[0], 'page': heir[1]}
+            return to_delete, promoted
+
+    def prune(self, live_ids) -> List[str]:
+        """Forget canonical chunks missing from the vector store.
+
+        Returns the sources that referenced them; their content is no longer
+        stored anywhere, so they need re-ingesting.
+        """
+        live_ids = set(live_ids)
+        with self._lock:
+            missing = [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks") if row[0] not in live_ids]
+            affected = set()
+            for chunk_id in missing:
+                affected.update(row[0] for row in self._conn.execute(
+                    "SELECT source FROM refs WHERE chunk_id = ?", (chunk_id,)
+                ))
+                self._conn.execute("DELETE FROM refs WHERE chunk_id = ?", (chunk_id,))
+                self._conn.execute("DELETE FROM bands WHERE chunk_id = ?", (chunk_id,))
+                self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+            self._conn.commit()
+            return sorted(affected)
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self) -> None:
+        with self._lock:
+            self._conn.rollback()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
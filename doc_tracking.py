@@ -0,0 +1,170 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    filename TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    last_modified REAL,
+    processed_date TEXT,
+    chunk_count INTEGER,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(hash);
+CREATE INDEX IF NOT EXISTS idx_documents_processed_date ON documents(processed_date);
+"""
+
+class DocumentTrackingStore:
+    def __init__(self, db_path: str, legacy_json_path: str = None, batch_size: int = 32):
+        """Open (or create) the SQLite tracking database in WAL mode."""
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._pending_writes = 0
+        # Batch nesting is per thread, so one thread's batch neither blocks
+        # nor defers the commits of writes made by other threads
+        self._local = threading.local()
+
+        is_new = not os.path.exists(db_path)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        if is_new and legacy_json_path and os.path.exists(legacy_json_path):
+            self._import_legacy_json(legacy_json_path)
+
+    def _import_legacy_json(self, json_path: str) -> None:
+        """Migrate entries from the old document_tracking.json file."""
+        try:
+            with open(json_path, 'r') as f:
+                tracking = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read legacy tracking file {json_path}: {str(e)}")
+            return
+
+        with self.batch():
+            for filename, metadata in tracking.items():
+                self.upsert(filename, metadata)
+        os.replace(json_path, json_path + ".migrated")
+        print(f"Migrated {len(tracking)} entries from {json_path}")
+
+    def _row_to_metadata(self, row: sqlite3.Row) -> Dict:
+        return json.loads(row['metadata'])
+
+    def _maybe_commit(self) -> None:
+        """Commit once enough writes are buffered, unless inside an explicit batch."""
+        self._pending_writes += 1
+        if getattr(self._local, 'batch_depth', 0) == 0 or self._pending_writes >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Commit any buffered writes."""
+        with self._lock:
+            if self._pending_writes:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    @contextmanager
+    def batch(self):
+        """Group this thread's writes so they are committed every batch_size rows and on exit.
+
+        The lock is only taken per write, never across the yield, so other
+        threads keep reading and writing while a batch is open.
+        """
+        self._local.batch_depth = getattr(self._local, 'batch_depth', 0) + 1
+        try:
+            yield self
+        finally:
+            self._local.batch_depth -= 1
+            if self._local.batch_depth == 0:
+                self.flush()
+
+    def get(self, filename: str) -> Optional[Dict]:
+        """Return the tracked metadata for a filename, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
+        return self._row_to_metadata(row) if row else None
+
+    def find_by_hash(self, file_hash: str) -> List[str]:
+        """Return filenames whose content hash matches."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename FROM documents WHERE hash = ?", (file_hash,)
+            ).fetchall()
+        return [row['filename'] for row in rows]
+
+    def upsert(self, filename: str, metadata: Dict) -> None:
+        """Insert or replace the tracking row for a filename."""
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO documents (filename, hash, last_modified, processed_date, chunk_count, metadata)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(filename) DO UPDATE SET
+                       hash = excluded.hash,
+                       last_modified = excluded.last_modified,
+                       processed_date = excluded.processed_date,
+                       chunk_count = excluded.chunk_count,
+                       metadata = excluded.metadata""",
+                (
+                    filename,
+                    metadata.get('hash', ''),
+                    metadata.get('last_modified'),
+                    metadata.get('processed_date', ''),
+                    metadata.get('chunk_count', 0),
+                    json.dumps(metadata),
+                )
+            )
+            self._maybe_commit()
+
+    def delete(self, filename: str) -> bool:
+        """Remove a filename from tracking. Returns True if a row was deleted."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+            self._maybe_commit()
+            return cursor.rowcount > 0
+
+    def clear(self) -> None:
+        """Remove every tracking row."""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._maybe_commit()
+
+    def all(self) -> Dict[str, Dict]:
+        """Return all tracked documents keyed by filename."""
+        with self._lock:
+            rows = self._conn.execute("SELECT filename, metadata FROM documents").fetchall()
+        return {row['filename']: self._row_to_metadata(row) for row in rows}
+
+    def list_documents(self) -> List[Dict]:
+        """Return (filename, metadata) rows ordered by processed date, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename, metadata FROM documents ORDER BY processed_date DESC"
+            ).fetchall()
+        return [{'filename': row['filename'], **self._row_to_metadata(row)} for row in rows]
+
+    def __contains__(self, filename: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE filename = ?", (filename,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        """Flush pending writes and close the database."""
+        with self._lock:
+            self.flush()
+            self._conn.close()
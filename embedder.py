@@ -1,11 +1,23 @@
-from embedding_text import PDFEmbedder
+from tenants import TenantIndexManager, DEFAULT_TENANT
 
 # Singleton instance
-_pdf_embedder = None
-
-def get_embedder():
-    """Get or create PDFEmbedder instance."""
-    global _pdf_embedder
-    if _pdf_embedder is None:
-        _pdf_embedder = PDFEmbedder()
-    return _pdf_embedder
+_tenant_manager = None
+
+def get_tenant_manager():
+    """Get or create the TenantIndexManager instance."""
+    global _tenant_manager
+    if _tenant_manager is None:
+        _tenant_manager = TenantIndexManager()
+    return _tenant_manager
+
+def get_embedder(tenant_id: str = DEFAULT_TENANT):
+    """Get the PDFEmbedder for a tenant (the shared default index if none is given).
+
+    Fine for the pinned default tenant; use tenant_lease for other tenants so
+    the shard cannot be evicted and closed while it is in use.
+    """
+    return get_tenant_manager().get(tenant_id)
+
+def tenant_lease(tenant_id: str = DEFAULT_TENANT):
+    """Context manager yielding a tenant's PDFEmbedder, held open for the block."""
+    return get_tenant_manager().lease(tenant_id)
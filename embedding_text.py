@@ -1,61 +1,127 @@
 import os
-import json
 import fitz
 import hashlib
+import threading
+import time
 import numpy as np
 from datetime import datetime
 from typing import List, Dict, Any
 from langchain_chroma import Chroma
 from langchain_nomic import NomicEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.text_splitter import CharacterTextSplitter
+from text_chunker import TokenChunker
+from doc_tracking import DocumentTrackingStore
+from flat_index import FlatVectorStore, matches_where
+from snapshots import SnapshotVectorStore, SnapshotTrackingView, publish_snapshot
+from query_filters import FilenameIndex, build_where_clause, detect_document_type
+from dedup import NearDuplicateIndex
 
 class PDFEmbedder:
-    def __init__(self, vector_db_path="vector_db"):
-        """Initialize the PDF embedder with vector store."""
+    def __init__(self, vector_db_path="vector_db", collection_name="reaic_docs", tracking_dir=None,
+                 pdf_dir="pdf_files", embeddings=None, backend=None, publish_snapshots=None, chroma_path=None):
+        """Initialize the PDF embedder with vector store.
+        
+        Each instance owns one collection and its tracking store, so a tenant
+        shard is just a PDFEmbedder with its own collection_name, tracking_dir
+        and pdf_dir. backend is "chroma" (default) or "flat" for the
+        memory-mapped FlatVectorStore; it defaults to the VECTOR_BACKEND env var.
+        chroma_path gives the shard its own Chroma directory (and client), so
+        close() can actually release its in-memory index.
+        
+        REAIC_ROLE selects the multi-process mode: "ingest" publishes flat index
+        snapshots after each ingest batch, "serve" uses the read-only "snapshot"
+        backend and never ingests. The default "all" does both in-process.
+        """
         try:
             self.vector_db_path = vector_db_path
+            self.collection_name = collection_name
+            self.pdf_dir = pdf_dir
+            self.chroma_path = chroma_path or vector_db_path
+            role = os.getenv("REAIC_ROLE", "all").lower()
+            if backend is None:
+                backend = "snapshot" if role == "serve" else os.getenv("VECTOR_BACKEND", "chroma")
+            self.backend = backend.lower()
+            self.read_only = self.backend == "snapshot"
+            self.publish_snapshots = role == "ingest" if publish_snapshots is None else publish_snapshots
+            self.snapshot_root = os.path.join(vector_db_path, "snapshots", collection_name)
+            self._snapshot_dirty = False
+            if self.publish_snapshots and self.backend != "flat":
+                raise ValueError("Publishing snapshots requires VECTOR_BACKEND=flat")
+            tracking_dir = tracking_dir or vector_db_path
             os.makedirs(vector_db_path, exist_ok=True)
+            os.makedirs(tracking_dir, exist_ok=True)
             
-            # Initialize the document tracking file
-            self.doc_tracking_path = os.path.join(vector_db_path, "document_tracking.json")
-            self.doc_tracking = self._load_doc_tracking()
+            # Initialize the document tracking store (migrates the legacy JSON file once).
+            # Serving workers read tracking from the snapshot instead, set up below.
+            self.doc_tracking_path = os.path.join(tracking_dir, "document_tracking.db")
+            if not self.read_only:
+                self.doc_store = DocumentTrackingStore(
+                    self.doc_tracking_path,
+                    legacy_json_path=os.path.join(tracking_dir, "document_tracking.json")
+                )
             
-            print("Initializing Nomic embeddings...")
-            os.environ["NOMIC_API_KEY"] = os.getenv("NOMIC_API_TOKEN", "")
-            self.embeddings = NomicEmbeddings(
-                model="nomic-embed-text-v1.5"
-            )
+            # Near-duplicate chunk index: repeated passages are embedded once and
+            # referenced from every source that contains them
+            self.dedup = None
+            if not self.read_only and os.getenv("DEDUP_ENABLED", "true").lower() == "true":
+                self.dedup = NearDuplicateIndex(os.path.join(tracking_dir, "dedup.db"))
             
-            # Initialize vector store first to ensure proper cleanup
-            print("Initializing Chroma vector store...")
-            self.vector_store = Chroma(
-                persist_directory=vector_db_path,
-                embedding_function=self.embeddings,
-                collection_name="reaic_docs"
-            )
+            # Ingest and search counters for this collection
+            self.stats = {
+                'files_processed': 0,
+                'chunks_added': 0,
+                'chunks_deduplicated': 0,
+                'ingest_seconds': 0.0,
+                'searches': 0,
+                'search_seconds': 0.0
+            }
             
-            # Get initial collection size
-            collection_size = len(self.vector_store.get()['ids']) if self.vector_store.get() else 0
+            # Serializes ingestion between startup scans and the directory watcher
+            self._ingest_lock = threading.RLock()
             
-            # Clear vector store if tracking is empty
-            if not self.doc_tracking and collection_size > 0:
-                print("Clearing vector store due to empty tracking file...")
-                # Get all existing IDs
-                if self.vector_store.get() and self.vector_store.get()['ids']:
-                    self.vector_store._collection.delete(
-                        ids=self.vector_store.get()['ids']
-                    )
-                print("Vector store cleared successfully")
+            # Token-aware chunker shared across all ingested files
+            self.chunker = TokenChunker(chunk_tokens=300, overlap_tokens=50)
             
-            # Verify vector store matches tracking
-            collection_size = len(self.vector_store.get()['ids']) if self.vector_store.get() else 0
-            print(f"Vector store initialized with {collection_size} documents")
+            if embeddings is None:
+                print("Initializing Nomic embeddings...")
+                os.environ["NOMIC_API_KEY"] = os.getenv("NOMIC_API_TOKEN", "")
+                embeddings = NomicEmbeddings(
+                    model="nomic-embed-text-v1.5"
+                )
+            self.embeddings = embeddings
+            
+            # Initialize vector store first to ensure proper cleanup
+            if self.backend == "flat":
+                print(f"Initializing flat vector store ({collection_name})...")
+                self.vector_store = FlatVectorStore(
+                    persist_directory=os.path.join(vector_db_path, "flat", collection_name),
+                    embedding_function=self.embeddings,
+                    dtype=os.getenv("FLAT_INDEX_DTYPE", "float16"),
+                    rescore=os.getenv("FLAT_INDEX_RESCORE", "true").lower() == "true"
+                )
+            elif self.backend == "snapshot":
+                print(f"Attaching to published snapshots ({collection_name})...")
+                self.vector_store = SnapshotVectorStore(self.snapshot_root, self.embeddings)
+                self.doc_store = SnapshotTrackingView(self.vector_store)
+            elif self.backend == "chroma":
+                print(f"Initializing Chroma vector store ({collection_name})...")
+                self.vector_store = Chroma(
+                    persist_directory=self.chroma_path,
+                    embedding_function=self.embeddings,
+                    collection_name=collection_name
+                )
+            else:
+                raise ValueError(f"Unknown vector backend: {self.backend}")
             
-            if collection_size == 0 and self.doc_tracking:
-                print("Warning: Vector store is empty but tracking file has entries. Clearing tracking...")
-                self.doc_tracking = {}
-                self._save_doc_tracking()
+            # Bring tracking and the vector store back in sync after any interrupted ingest
+            if not self.read_only:
+                self._reconcile_tracking()
+            
+            # In-memory filename index for detecting documents named in queries
+            self.filename_index = FilenameIndex(self.doc_store.all().keys())
+            if self.read_only:
+                self.vector_store.on_swap(
+                    lambda: setattr(self, 'filename_index', FilenameIndex(self.doc_store.all().keys()))
+                )
             
         except Exception as e:
             print(f"Error initializing PDFEmbedder: {str(e)}")
@@ -69,32 +135,90 @@ class PDFEmbedder:
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
     
-    def _load_doc_tracking(self) -> Dict:
-        """Load document tracking information."""
-        if os.path.exists(self.doc_tracking_path):
-            with open(self.doc_tracking_path, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def _save_doc_tracking(self):
-        """Save document tracking information."""
-        with open(self.doc_tracking_path, 'w') as f:
-            json.dump(self.doc_tracking, f, indent=2)
+    def _reconcile_tracking(self):
+        """Repair tracking from chunk metadata instead of wiping the vector store.
+
+        Chunks are written before their tracking row, so a crash can leave chunks
+        without a row (or with a stale one). Sources whose chunk set is complete
+        are re-tracked; partial ones are dropped so they get re-ingested.
+        """
+        stored = self.vector_store.get(include=['metadatas'])
+        by_source = {}
+        for chunk_id, metadata in zip(stored['ids'], stored['metadatas']):
+            metadata = metadata or {}
+            by_source.setdefault(metadata.get('source'), []).append((chunk_id, metadata))
+        
+        tracked = self.doc_store.all()
+        repaired = dropped = 0
+        
+        # Sources that only referenced chunks which are gone must be re-ingested
+        stale = set(self.dedup.prune(stored['ids'])) if self.dedup is not None else set()
+        
+        with self.doc_store.batch():
+            for source, chunks in by_source.items():
+                # Chunks inherited from a removed duplicate do not count toward chunk_count
+                own = [(chunk_id, m) for chunk_id, m in chunks if not m.get('dedup_promoted')]
+                metadata = (own or chunks)[0][1]
+                hashes = {m.get('hash') for _, m in chunks}
+                complete = (
+                    source is not None and
+                    source not in stale and
+                    len(hashes) == 1 and
+                    len(own) == metadata.get('chunk_count')
+                )
+                row = tracked.get(source)
+                
+                if complete and row and row.get('hash') == metadata.get('hash'):
+                    continue
+                
+                if complete:
+                    self.doc_store.upsert(source, {
+                        key: metadata[key]
+                        for key in ('source', 'hash', 'last_modified', 'processed_date', 'processed_ts',
+                                    'document_type', 'chunk_count')
+                        if key in metadata
+                    })
+                    repaired += 1
+                elif source is None:
+                    self.vector_store.delete(ids=[chunk_id for chunk_id, _ in chunks])
+                    dropped += 1
+                else:
+                    self._remove_from_index(source)
+                    self.doc_store.delete(source)
+                    dropped += 1
+            
+            # Rows without any chunks point at nothing searchable, unless every
+            # chunk of the document was a duplicate stored under another source
+            for source in tracked.keys() - by_source.keys():
+                if tracked[source].get('chunk_count') == 0 and source not in stale:
+                    continue
+                self._remove_from_index(source)
+                self.doc_store.delete(source)
+                dropped += 1
+        
+        print(f"Vector store initialized with {len(stored['ids'])} chunks from {len(self.doc_store)} documents")
+        if repaired or dropped:
+            print(f"Reconciled tracking: {repaired} repaired, {dropped} dropped for re-ingest")
     
     def _should_process_file(self, file_path: str) -> bool:
         """Check if a file should be processed based on its hash and last modified time."""
-        file_hash = self._compute_file_hash(file_path)
         file_stat = os.stat(file_path)
         file_name = os.path.basename(file_path)
         
-        if file_name not in self.doc_tracking:
+        tracked_info = self.doc_store.get(file_name)
+        if tracked_info is None:
             return True
-            
-        tracked_info = self.doc_tracking[file_name]
-        return (
-            tracked_info['hash'] != file_hash or
-            tracked_info['last_modified'] != file_stat.st_mtime
-        )
+        
+        # Unchanged mtime: skip without reading the file
+        if tracked_info['last_modified'] == file_stat.st_mtime:
+            return False
+        
+        # Touched but identical content: record the new mtime instead of re-embedding
+        if tracked_info['hash'] == self._compute_file_hash(file_path):
+            self.doc_store.upsert(file_name, {**tracked_info, 'last_modified': file_stat.st_mtime})
+            return False
+        
+        return True
 
     def _clean_text(self, text: str) -> str:
         """Clean and normalize text content."""
@@ -110,48 +234,151 @@ class PDFEmbedder:
             cleaned_lines.append(line)
         return '\n'.join(cleaned_lines)
 
-    def _split_text(self, text: str, title: str = "") -> List[str]:
-        """Split text into chunks using multiple strategies."""
-        # First split by sections/paragraphs
-        section_splitter = RecursiveCharacterTextSplitter(
-            separators=["\n\n", "\n", ". ", " "],
-            chunk_size=1500,
-            chunk_overlap=200,
-            length_function=len,
-            is_separator_regex=False
-        )
-        
-        # Then split by sentences within sections
-        sentence_splitter = CharacterTextSplitter(
-            separator=".",
-            chunk_size=500,
-            chunk_overlap=50,
-            length_function=len,
-            is_separator_regex=False
-        )
-        
-        # Get initial chunks
-        chunks = section_splitter.split_text(text)
-        final_chunks = []
+    def _split_text(self, pages: List[str]) -> List[Dict[str, Any]]:
+        """Split cleaned page texts into token-bounded chunks with page ranges."""
+        return self.chunker.split_pages(pages)
+    
+    def process_file(self, file_path: str) -> bool:
+        """Embed a single PDF if it is new or changed. Returns True if it was (re)indexed."""
+        filename = os.path.basename(file_path)
+        self._check_writable()
         
-        for chunk in chunks:
-            # Add title context to longer chunks
-            if len(chunk) > 1000 and title:
-                chunk = f"From {title}: {chunk}"
+        with self._ingest_lock:
+            if not self._should_process_file(file_path):
+                print(f"Skipping {filename} - no changes detected")
+                return False
             
-            # Further split longer chunks by sentences
-            if len(chunk) > 1000:
-                sub_chunks = sentence_splitter.split_text(chunk)
-                final_chunks.extend(sub_chunks)
-            else:
-                final_chunks.append(chunk)
-        
-        return final_chunks
+            print(f"Processing {filename}...")
+            doc = None
+            started = time.perf_counter()
+            
+            try:
+                # Open and read PDF
+                doc = fitz.open(file_path)
+                
+                # Extract and clean text page by page so chunks keep page numbers
+                pages = [self._clean_text(doc[page_num].get_text()) for page_num in range(len(doc))]
+                
+                if not any(page.strip() for page in pages):
+                    raise ValueError("No text content extracted from PDF")
+                
+                # Split text into chunks
+                chunks = self._split_text(pages)
+                text_chunks = [chunk['text'] for chunk in chunks]
+                
+                if not text_chunks:
+                    raise ValueError("No valid text chunks generated")
+                
+                print(f"Generated {len(text_chunks)} chunks")
+                
+                # Create metadata
+                file_stat = os.stat(file_path)
+                processed_at = datetime.now()
+                metadata = {
+                    'source': filename,
+                    'hash': self._compute_file_hash(file_path),
+                    'last_modified': file_stat.st_mtime,
+                    'processed_date': processed_at.isoformat(),
+                    'processed_ts': processed_at.timestamp(),
+                    'document_type': detect_document_type(filename, next((p for p in pages if p.strip()), "")),
+                    'chunk_count': len(text_chunks)
+                }
+                
+                # Generate unique IDs for chunks (position keeps repeated text distinct)
+                chunk_ids = [
+                    f"{filename}_{i}_{hashlib.md5(chunk.encode()).hexdigest()}"
+                    for i, chunk in enumerate(text_chunks)
+                ]
+                
+                # Drop chunks from a previous version of this file
+                self._remove_from_index(filename)
+                
+                # Near-duplicates of chunks already indexed (from this or any other
+                # source) are recorded as references instead of embedded again, but
+                # only when they agree on every number, amount and date
+                keep = list(range(len(chunks)))
+                if self.dedup is not None:
+                    keep = []
+                    for i, chunk in enumerate(chunks):
+                        signature = self.dedup.hasher.signature(chunk['text'])
+                        duplicate_of = self.dedup.find_duplicate(signature, chunk['text'])
+                        if duplicate_of is not None:
+                            self.dedup.add_reference(duplicate_of, filename, chunk['page'], chunk['page_end'])
+                        else:
+                            self.dedup.add_canonical(chunk_ids[i], filename, signature, chunk['text'])
+                            keep.append(i)
+                metadata['chunk_count'] = len(keep)
+                metadata['duplicate_chunks'] = len(chunks) - len(keep)
+                
+                # Add to vector store
+                if keep:
+                    self.vector_store.add_texts(
+                        texts=[text_chunks[i] for i in keep],
+                        ids=[chunk_ids[i] for i in keep],
+                        metadatas=[
+                            {
+                                **metadata,
+                                'chunk_id': i,
+                                'chunk_uid': chunk_ids[i],
+                                'chunk': i,
+                                'total_chunks': len(chunks),
+                                'title': os.path.splitext(filename)[0],
+                                'page': chunks[i]['page'],
+                                'page_end': chunks[i]['page_end'],
+                                'tokens': chunks[i]['tokens']
+                            }
+                            for i in keep
+                        ]
+                    )
+                
+                # Update tracking
+                self.doc_store.upsert(filename, metadata)
+                if self.dedup is not None:
+                    self.dedup.commit()
+                self.filename_index.add(filename)
+                self._snapshot_dirty = True
+                
+                self.stats['files_processed'] += 1
+                self.stats['chunks_added'] += len(keep)
+                self.stats['chunks_deduplicated'] += len(chunks) - len(keep)
+                self.stats['ingest_seconds'] += time.perf_counter() - started
+                
+                print(f"Successfully processed {filename}")
+                return True
+                
+            except Exception:
+                # Clean up any partial processing
+                if self.dedup is not None:
+                    self.dedup.rollback()
+                self._remove_from_index(filename)
+                self.doc_store.delete(filename)
+                raise
+                
+            finally:
+                if doc is not None:
+                    doc.close()
     
-    def process_new_pdfs(self, pdf_dir="pdf_files") -> int:
+    def process_files(self, file_paths: List[str]) -> Dict[str, Any]:
+        """Process a specific list of PDF files."""
+        self._check_writable()
+        processed = []
+        errors = []
+        with self.doc_store.batch():
+            for file_path in file_paths:
+                try:
+                    if self.process_file(file_path):
+                        processed.append(os.path.basename(file_path))
+                except Exception as e:
+                    errors.append(f"Error processing {os.path.basename(file_path)}: {str(e)}")
+        self.publish_snapshot()
+        return {'processed': processed, 'errors': errors}
+    
+    def process_new_pdfs(self, pdf_dir=None) -> int:
         """Process any new or modified PDFs in the specified directory."""
+        self._check_writable()
         processed_count = 0
         errors = []
+        pdf_dir = pdf_dir or self.pdf_dir
         
         try:
             # Ensure PDF directory exists
@@ -167,102 +394,175 @@ class PDFEmbedder:
             
             print(f"Found {len(pdf_files)} PDF files")
             
-            # Process each PDF file
-            for filename in pdf_files:
-                file_path = os.path.join(pdf_dir, filename)
-                
-                try:
-                    if not self._should_process_file(file_path):
-                        print(f"Skipping {filename} - no changes detected")
-                        continue
-                    
-                    print(f"Processing {filename}...")
-                    
-                    # Open and read PDF
-                    doc = fitz.open(file_path)
-                    text_content = ""
-                    
-                    # Extract text from each page
-                    for page_num in range(len(doc)):
-                        page = doc[page_num]
-                        text_content += page.get_text()
-                    
-                    # Clean the extracted text
-                    cleaned_text = self._clean_text(text_content)
-                    
-                    if not cleaned_text.strip():
-                        raise ValueError("No text content extracted from PDF")
-                    
-                    # Split text into chunks
-                    text_chunks = self._split_text(cleaned_text, title=filename)
-                    
-                    if not text_chunks:
-                        raise ValueError("No valid text chunks generated")
-                    
-                    print(f"Generated {len(text_chunks)} chunks")
-                    
-                    # Create metadata
-                    file_stat = os.stat(file_path)
-                    metadata = {
-                        'source': filename,
-                        'hash': self._compute_file_hash(file_path),
-                        'last_modified': file_stat.st_mtime,
-                        'processed_date': datetime.now().isoformat(),
-                        'chunk_count': len(text_chunks)
-                    }
-                    
-                    # Generate unique IDs for chunks
-                    chunk_ids = [
-                        f"{filename}_{hashlib.md5(chunk.encode()).hexdigest()}"
-                        for chunk in text_chunks
-                    ]
-                    
-                    # Add to vector store
-                    self.vector_store.add_texts(
-                        texts=text_chunks,
-                        ids=chunk_ids,
-                        metadatas=[{**metadata, 'chunk_id': i} for i, _ in enumerate(text_chunks)]
-                    )
-                    
-                    # Update tracking
-                    self.doc_tracking[filename] = metadata
-                    self._save_doc_tracking()
-                    
-                    processed_count += 1
-                    print(f"Successfully processed {filename}")
-                    
-                except Exception as e:
-                    error_msg = f"Error processing {filename}: {str(e)}"
-                    print(error_msg)
-                    errors.append(error_msg)
-                    
-                    # Clean up any partial processing
-                    if filename in self.doc_tracking:
-                        del self.doc_tracking[filename]
-                        self._save_doc_tracking()
-                    
-                finally:
-                    if 'doc' in locals():
-                        doc.close()
+            # Process each PDF file, committing tracking rows in batches
+            with self.doc_store.batch():
+                for filename in pdf_files:
+                    try:
+                        if self.process_file(os.path.join(pdf_dir, filename)):
+                            processed_count += 1
+                    except Exception as e:
+                        error_msg = f"Error processing {filename}: {str(e)}"
+                        print(error_msg)
+                        errors.append(error_msg)
             
             if errors:
                 print(f"Completed with {len(errors)} errors:")
                 for error in errors:
                     print(f"  - {error}")
             
+            self.publish_snapshot()
             return processed_count
             
         except Exception as e:
             print(f"Error in process_new_pdfs: {str(e)}")
             raise
 
-    def similarity_search(self, query: str, k: int = 4) -> List[Dict[str, Any]]:
-        """Search for similar content in the vector store."""
+    def _remove_from_index(self, filename: str) -> int:
+        """Delete every chunk belonging to a source file from the vector store.
+
+        Chunks that other sources reference as duplicates are handed over to
+        one of them by rewriting their metadata, so nothing is re-embedded.
+        """
+        existing = self.vector_store.get(where={'source': filename})
+        chunk_ids = existing['ids'] if existing else []
+        
+        if self.dedup is not None:
+            _, promoted = self.dedup.release_source(filename)
+            if promoted:
+                heirs = {ref['source']: self.doc_store.get(ref['source']) or {} for ref in promoted.values()}
+                by_id = dict(zip(existing['ids'], existing['metadatas'])) if existing else {}
+                updates = {}
+                for chunk_id, ref in promoted.items():
+                    if chunk_id not in by_id:
+                        continue
+                    updates[chunk_id] = {
+                        **(by_id[chunk_id] or {}),
+                        **heirs[ref['source']],
+                        'source': ref['source'],
+                        'title': os.path.splitext(ref['source'])[0],
+                        'page': ref['page'],
+                        'page_end': ref['page'],
+                        'dedup_promoted': True
+                    }
+                self._update_metadatas(list(updates), list(updates.values()))
+                chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in updates]
+            self.dedup.commit()
+        
+        if chunk_ids:
+            print(f"Deleting {len(chunk_ids)} chunks from vector store...")
+            self.vector_store.delete(ids=chunk_ids)
+        return len(chunk_ids)
+    
+    def _update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Rewrite chunk metadata in place on either writable backend."""
+        if not ids:
+            return
+        if self.backend == "flat":
+            self.vector_store.update_metadatas(ids, metadatas)
+        else:
+            self.vector_store._collection.update(ids=ids, metadatas=metadatas)
+
+    def remove_document(self, filename: str) -> bool:
+        """Drop a document's chunks and tracking entry, leaving the PDF file alone."""
+        self._check_writable()
+        with self._ingest_lock:
+            removed = self._remove_from_index(filename)
+            self.filename_index.remove(filename)
+            removed = self.doc_store.delete(filename) or bool(removed)
+            self._snapshot_dirty = self._snapshot_dirty or removed
+            return removed
+
+    def _check_writable(self):
+        """Refuse to ingest in a read-only serving worker."""
+        if self.read_only:
+            raise RuntimeError("This worker serves read-only snapshots; ingest through the owner process")
+
+    def publish_snapshot(self, force: bool = False):
+        """Publish a new snapshot if this is the ingestion owner and the index changed."""
+        if not self.publish_snapshots or not (self._snapshot_dirty or force):
+            return None
+        with self._ingest_lock:
+            self.doc_store.flush()
+            documents = self.doc_store.all()
+            # Serving workers have no dedup index; they expand filters from these
+            if self.dedup is not None:
+                for source, refs in self.dedup.references_by_source(list(documents)).items():
+                    documents[source] = {**documents[source], 'duplicate_refs': refs}
+            version = publish_snapshot(self.vector_store, documents, self.snapshot_root)
+            self._snapshot_dirty = False
+            return version
+
+    def detect_sources(self, query: str) -> List[str]:
+        """Return tracked filenames that the query mentions by name."""
+        return self.filename_index.match(query)
+
+    def _duplicate_refs(self, filters: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Canonical chunks that documents matching filters contain as deduplicated copies.
+        
+        A deduplicated chunk is stored once under its owner's source, type and
+        pages, so a filter on another document that contains it would miss it.
+        Returns {chunk id: metadata of the first matching copy}, which the
+        search ORs into the where clause and uses to label the result.
+        """
+        document_filters = {key: value for key, value in filters.items() if key not in ('page_from', 'page_to')}
+        document_where = build_where_clause(document_filters)
+        sources = filters.get('source')
+        if sources:
+            sources = [sources] if isinstance(sources, str) else list(sources)
+            documents = {source: self.doc_store.get(source) for source in sources}
+        else:
+            documents = self.doc_store.all()
+        documents = {
+            source: {'source': source, **meta} for source, meta in documents.items()
+            if meta is not None and matches_where({'source': source, **meta}, document_where)
+        }
+        if not documents:
+            return {}
+        
+        if self.dedup is not None:
+            refs_by_source = self.dedup.references_by_source(list(documents))
+        else:
+            refs_by_source = {source: meta.get('duplicate_refs', []) for source, meta in documents.items()}
+        
+        page_from, page_to = filters.get('page_from'), filters.get('page_to')
+        copies = {}
+        for source, refs in sorted(refs_by_source.items()):
+            meta = documents[source]
+            for chunk_id, page, page_end in refs:
+                if page_from is not None and page_end < int(page_from):
+                    continue
+                if page_to is not None and page > int(page_to):
+                    continue
+                copies.setdefault(chunk_id, {
+                    'source': source,
+                    'title': os.path.splitext(source)[0],
+                    'page': page,
+                    'page_end': page_end,
+                    'document_type': meta.get('document_type', 'other'),
+                    'processed_date': meta.get('processed_date', '')
+                })
+        return copies
+
+    def similarity_search(self, query: str, k: int = 4, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Search for similar content in the vector store.
+        
+        filters (source, document_type, processed_after/before, page_from/to) are
+        applied inside the vector query; see query_filters.build_where_clause.
+        Deduplicated chunks that matching documents contain are included too,
+        labelled with the matching document.
+        """
         try:
             print(f"\nPerforming similarity search for: {query}")
+            where = build_where_clause(filters)
+            copies = self._duplicate_refs(filters) if where else {}
+            if copies:
+                where = {'$or': [where, {'chunk_uid': {'$in': sorted(copies)}}]}
             
             # Get results from vector store
-            results = self.vector_store.similarity_search_with_score(query, k=k*2)
+            started = time.perf_counter()
+            results = self.vector_store.similarity_search_with_score(query, k=k*2, filter=where)
+            self.stats['searches'] += 1
+            self.stats['search_seconds'] += time.perf_counter() - started
             
             if not results:
                 print("No results found in vector store")
@@ -276,15 +576,23 @@ class PDFEmbedder:
                 
                 # Get metadata with defaults
                 metadata = doc.metadata if hasattr(doc, 'metadata') else {}
+                if metadata.get('chunk_uid') in copies and not matches_where(metadata, where['$or'][0]):
+                    # Matched only as a copy: report the document the filter asked for
+                    metadata = {**metadata, **copies[metadata['chunk_uid']]}
                 
                 # Create result entry
                 result = {
                     'content': doc.page_content,
+                    'chunk_uid': metadata.get('chunk_uid'),
                     'metadata': {
                         'source': metadata.get('source', 'Unknown'),
                         'title': metadata.get('title', ''),
                         'chunk': metadata.get('chunk', 0),
                         'total_chunks': metadata.get('total_chunks', 1),
+                        'page': metadata.get('page', 1),
+                        'page_end': metadata.get('page_end', metadata.get('page', 1)),
+                        'document_type': metadata.get('document_type', 'other'),
+                        'processed_date': metadata.get('processed_date', ''),
                         'words': len(doc.page_content.split()),
                         'raw_similarity': score,
                         'normalized_score': normalized_score
@@ -294,31 +602,75 @@ class PDFEmbedder:
             
             # Sort by normalized score (higher is better) and take top k
             processed_results.sort(key=lambda x: x['metadata']['normalized_score'], reverse=True)
-            return processed_results[:k]
+            processed_results = processed_results[:k]
+            
+            # Point at the other documents that contain a deduplicated chunk
+            if self.dedup is not None:
+                references = self.dedup.references([r['chunk_uid'] for r in processed_results if r.get('chunk_uid')])
+                for result in processed_results:
+                    result['metadata']['also_in'] = references.get(result.pop('chunk_uid', None), [])
+            else:
+                for result in processed_results:
+                    result.pop('chunk_uid', None)
+            return processed_results
             
         except Exception as e:
             print(f"Error in similarity search: {str(e)}")
             return []
 
+    def count(self) -> int:
+        """Return the number of chunks in this collection."""
+        if self.backend in ("flat", "snapshot"):
+            return self.vector_store.count()
+        return self.vector_store._collection.count()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return ingest/search counters plus current collection size."""
+        stats = dict(self.stats)
+        stats['documents'] = len(self.doc_store)
+        stats['chunks'] = self.count()
+        stats['avg_search_ms'] = (
+            1000 * stats['search_seconds'] / stats['searches'] if stats['searches'] else 0.0
+        )
+        return stats
+
+    def close(self):
+        """Release the tracking database, dedup index and vector store handles."""
+        self.doc_store.close()
+        if self.dedup is not None:
+            self.dedup.close()
+        if self.backend in ("flat", "snapshot"):
+            self.vector_store.close()
+        elif self.chroma_path != self.vector_db_path:
+            self._release_chroma_client()
+    
+    def _release_chroma_client(self):
+        """Stop this shard's Chroma client so its loaded index memory is freed.
+        
+        chromadb caches one system per persist directory, so this is only done
+        for a dedicated chroma_path; a shared directory may back other shards.
+        """
+        client = getattr(self.vector_store, '_client', None)
+        system = getattr(client, '_system', None)
+        if system is None:
+            return
+        try:
+            getattr(type(client), '_identifier_to_system', {}).pop(getattr(client, '_identifier', None), None)
+            system.stop()
+        except Exception as e:
+            print(f"Error releasing Chroma client for {self.collection_name}: {str(e)}")
+
     def get_document_list(self) -> List[Dict]:
         """Get list of processed documents with metadata."""
         try:
-            if not os.path.exists(self.doc_tracking_path):
-                return []
-                
-            with open(self.doc_tracking_path, 'r') as f:
-                tracking_data = json.load(f)
-                
-            documents = []
-            for filename, metadata in tracking_data.items():
-                doc_info = {
-                    'id': filename,
-                    'filename': filename,
-                    'uploaded_at': metadata.get('processed_date', '')
+            return [
+                {
+                    'id': row['filename'],
+                    'filename': row['filename'],
+                    'uploaded_at': row.get('processed_date', '')
                 }
-                documents.append(doc_info)
-                
-            return sorted(documents, key=lambda x: x['uploaded_at'], reverse=True)
+                for row in self.doc_store.list_documents()
+            ]
             
         except Exception as e:
             print(f"Error getting document list: {str(e)}")
@@ -327,40 +679,20 @@ class PDFEmbedder:
     def delete_document(self, document_id: str) -> bool:
         """Delete a document and its embeddings."""
         try:
-            if not os.path.exists(self.doc_tracking_path):
-                return False
-                
-            # Load tracking data
-            with open(self.doc_tracking_path, 'r') as f:
-                tracking_data = json.load(f)
-                
+            self._check_writable()
+            
             # Check if document exists
-            if document_id not in tracking_data:
+            if document_id not in self.doc_store:
                 return False
 
             # Delete the actual PDF file
-            pdf_path = os.path.join('pdf_files', document_id)
+            pdf_path = os.path.join(self.pdf_dir, document_id)
             if os.path.exists(pdf_path):
                 os.remove(pdf_path)
                 print(f"Deleted PDF file: {pdf_path}")
 
-            # Delete from vector store
-            # Get all chunk IDs for this document
-            chunk_ids = [
-                f"{document_id}_{hashlib.md5(str(i).encode()).hexdigest()}"
-                for i in range(tracking_data[document_id].get('chunk_count', 0))
-            ]
-            
-            if chunk_ids:
-                print(f"Deleting {len(chunk_ids)} chunks from vector store...")
-                self.vector_store._collection.delete(ids=chunk_ids)
-                
-            # Remove from tracking
-            del tracking_data[document_id]
-            
-            # Save updated tracking
-            with open(self.doc_tracking_path, 'w') as f:
-                json.dump(tracking_data, f, indent=2)
+            # Delete its chunks from the vector store and drop tracking
+            self.remove_document(document_id)
                 
             print(f"Successfully deleted document {document_id} and all related data")
             return True
@@ -368,6 +700,3 @@ class PDFEmbedder:
         except Exception as e:
             print(f"Error deleting document: {str(e)}")
             return False
-
-# Initialize the embedder
-pdf_embedder = PDFEmbedder()
@@ -0,0 +1,809 @@
+import os
+import json
+import sqlite3
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.documents import Document
+
+SUPPORTED_DTYPES = ('float32', 'float16', 'int8')
+
+# Rows scored per matmul block, bounds the float32 temporary for quantized rows
+SCORE_BLOCK_ROWS = 16384
+# Below this share of candidate rows a query gathers just those rows (block by
+# block); otherwise it scans the whole matrix and masks out the rest
+GATHER_FRACTION = 0.05
+
+RECORDS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS compaction (
+    size INTEGER NOT NULL,
+    capacity INTEGER NOT NULL
+);
+"""
+
+MATRIX_NAMES = ('vectors', 'scales', 'full')
+# Snapshots carry their metadata columns as column_<field>.npy plus this file
+COLUMNS_FILE = "columns.json"
+# Rows per SQLite IN (...) lookup
+SQL_BATCH_ROWS = 900
+
+# Metadata fields mirrored into NumPy columns so where clauses on them are
+# evaluated as vector masks; other fields fall back to a per-row check
+CATEGORICAL_COLUMNS = ('source', 'document_type')
+NUMERIC_COLUMNS = ('processed_ts', 'page', 'page_end')
+# Metadata field that mirrors the record id; conditions on it use the id lookup
+ID_FIELD = 'chunk_uid'
+MISSING_CODE = -1
+UNINDEXED_CODE = -2
+UNKNOWN_CODE = -3
+
+def _as_number(value) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return None
+
+def _match_condition(metadata: Dict[str, Any], field: str, condition) -> bool:
+    value = metadata.get(field)
+    if not isinstance(condition, dict):
+        return value == condition
+    for op, expected in condition.items():
+        if op == '$eq' and value != expected:
+            return False
+        if op == '$ne' and value == expected:
+            return False
+        if op == '$in' and value not in expected:
+            return False
+        if op == '$nin' and value in expected:
+            return False
+        if op in ('$gt', '$gte', '$lt', '$lte'):
+            if value is None:
+                return False
+            if op == '$gt' and not value > expected:
+                return False
+            if op == '$gte' and not value >= expected:
+                return False
+            if op == '$lt' and not value < expected:
+                return False
+            if op == '$lte' and not value <= expected:
+                return False
+    return True
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Chroma-style where clause against one metadata dict."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif not _match_condition(metadata, key, condition):
+            return False
+    return True
+
+class FlatVectorStore:
+    def __init__(self, persist_directory: str, embedding_function, dtype: str = "float16",
+                 rescore: bool = True, rescore_factor: int = 4, compact_ratio: float = 0.3,
+                 read_only: bool = False):
+        """Exact-search vector store over a contiguous memory-mapped matrix.
+
+        Rows are L2-normalized and stored as float32, float16 or int8 (with a
+        per-row scale). With rescore enabled a float32 copy is kept on disk and
+        the top k * rescore_factor candidates are re-ranked at full precision.
+        Distances are squared L2 between unit vectors, matching Chroma's default.
+        read_only maps an existing (e.g. snapshot) directory with mode 'r' so
+        its pages can be shared between processes; writes then raise. A
+        snapshot with published metadata columns is opened lazily: filters
+        use the mapped columns, and ids, texts and metadata are read from
+        records.db per result instead of being loaded for every row.
+        """
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype!r}, expected one of {SUPPORTED_DTYPES}")
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.rescore = rescore and dtype != 'float32'
+        self.rescore_factor = max(1, rescore_factor)
+        self.compact_ratio = compact_ratio
+        self.read_only = read_only
+        self._mmap_mode = 'r' if read_only else 'r+'
+        self._lock = threading.RLock()
+
+        self._header_path = os.path.join(persist_directory, "header.json")
+        records_path = os.path.join(persist_directory, "records.db")
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{records_path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(persist_directory, exist_ok=True)
+            self._conn = sqlite3.connect(records_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(RECORDS_SCHEMA)
+            self._conn.commit()
+
+        self._vectors = None
+        self._scales = None
+        self._full = None
+        self.dim = 0
+        self.capacity = 0
+        self.size = 0
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, f"{name}.npy")
+
+    def _recover_compaction(self) -> None:
+        """Finish or discard a compaction interrupted by a crash.
+
+        compact() fsyncs the staged matrices, then commits the row renumbering
+        together with a compaction marker, and only then swaps files. A marker
+        means the staged files are complete and must be swapped in; without
+        one, leftover staged files are discarded.
+        """
+        marker = self._conn.execute("SELECT size, capacity FROM compaction").fetchone()
+        if marker is None:
+            for name in MATRIX_NAMES:
+                if os.path.exists(self._path(name) + ".tmp"):
+                    os.remove(self._path(name) + ".tmp")
+            return
+        for name in MATRIX_NAMES:
+            if os.path.exists(self._path(name) + ".tmp"):
+                os.replace(self._path(name) + ".tmp", self._path(name))
+        with open(self._header_path, 'r') as f:
+            header = json.load(f)
+        self.dim = header['dim']
+        self.size, self.capacity = marker
+        self._write_header()
+        self._conn.execute("DELETE FROM compaction")
+        self._conn.commit()
+
+    def _load_columns(self) -> None:
+        """Map a snapshot's published metadata columns; nothing per row is parsed."""
+        with open(os.path.join(self.persist_directory, COLUMNS_FILE), 'r') as f:
+            columns = json.load(f)
+        self._vocab = {
+            field: {value: code for code, value in enumerate(values)} for field, values in columns['vocab'].items()
+        }
+        self._column_exact = columns['exact']
+        self._categorical = {
+            field: np.load(self._path(f"column_{field}"), mmap_mode='r') for field in CATEGORICAL_COLUMNS
+        }
+        self._numeric = {field: np.load(self._path(f"column_{field}"), mmap_mode='r') for field in NUMERIC_COLUMNS}
+        # Snapshots are compacted: every row is live
+        self._valid = np.zeros(self.capacity, dtype=bool)
+        self._valid[:self.size] = True
+        self._ids = self._metadatas = self._row_by_id = None
+
+    def _load(self) -> None:
+        """Map existing matrices and rebuild the in-memory row tables from records.db."""
+        if not self.read_only:
+            self._recover_compaction()
+        if os.path.exists(self._header_path):
+            with open(self._header_path, 'r') as f:
+                header = json.load(f)
+            if header['dtype'] != self.dtype:
+                raise ValueError(
+                    f"Index at {self.persist_directory} was built as {header['dtype']}, not {self.dtype}"
+                )
+            self.dim = header['dim']
+            self.capacity = header['capacity']
+            self.size = header['size']
+            self._vectors = np.load(self._path("vectors"), mmap_mode=self._mmap_mode)
+            if self.dtype == 'int8':
+                self._scales = np.load(self._path("scales"), mmap_mode=self._mmap_mode)
+            if self.rescore and os.path.exists(self._path("full")):
+                self._full = np.load(self._path("full"), mmap_mode=self._mmap_mode)
+            elif self.rescore:
+                # Built without full-precision rows; nothing to re-score against
+                self.rescore = False
+
+        self._lazy = self.read_only and os.path.exists(os.path.join(self.persist_directory, COLUMNS_FILE))
+        if self._lazy:
+            self._load_columns()
+            return
+
+        self._ids: List[Optional[str]] = [None] * self.size
+        self._metadatas: List[Optional[Dict[str, Any]]] = [None] * self.size
+        self._valid = np.zeros(self.capacity, dtype=bool)
+        self._row_by_id: Dict[str, int] = {}
+        self._vocab: Dict[str, Dict[str, int]] = {field: {} for field in CATEGORICAL_COLUMNS}
+        self._column_exact: Dict[str, bool] = {field: True for field in CATEGORICAL_COLUMNS + NUMERIC_COLUMNS}
+        self._categorical = {field: np.full(self.capacity, MISSING_CODE, dtype=np.int32) for field in CATEGORICAL_COLUMNS}
+        self._numeric = {field: np.full(self.capacity, np.nan) for field in NUMERIC_COLUMNS}
+        for row, record_id, metadata in self._conn.execute("SELECT row, id, metadata FROM records"):
+            if row >= self.size:
+                # Written after the last header flush: the vector row is not trusted
+                continue
+            self._ids[row] = record_id
+            self._metadatas[row] = json.loads(metadata)
+            self._valid[row] = True
+            self._row_by_id[record_id] = row
+            self._set_columns(row, self._metadatas[row])
+        if not self.read_only:
+            self._conn.execute("DELETE FROM records WHERE row >= ?", (self.size,))
+            self._conn.commit()
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError(f"Flat index at {self.persist_directory} is read-only")
+
+    def _set_columns(self, row: int, metadata: Dict[str, Any]) -> None:
+        """Mirror a row's filterable metadata into the NumPy columns."""
+        for field in CATEGORICAL_COLUMNS:
+            value = metadata.get(field)
+            if value is None:
+                code = MISSING_CODE
+            elif isinstance(value, str):
+                vocab = self._vocab[field]
+                code = vocab.setdefault(value, len(vocab))
+            else:
+                self._column_exact[field] = False
+                code = UNINDEXED_CODE
+            self._categorical[field][row] = code
+        for field in NUMERIC_COLUMNS:
+            value = metadata.get(field)
+            number = _as_number(value)
+            if number is None and value is not None:
+                self._column_exact[field] = False
+            self._numeric[field][row] = np.nan if number is None else number
+
+    def _resize_columns(self, capacity: int, keep=None) -> None:
+        """Grow the columns to capacity, or gather the kept rows when compacting."""
+        for columns, fill in ((self._categorical, MISSING_CODE), (self._numeric, np.nan)):
+            for field, old in columns.items():
+                column = np.full(capacity, fill, dtype=old.dtype)
+                if keep is None:
+                    column[:self.size] = old[:self.size]
+                else:
+                    column[:len(keep)] = old[keep]
+                columns[field] = column
+
+    def _column_mask(self, field: str, condition, size: int) -> Optional[np.ndarray]:
+        """Vectorized mask for one field condition, or None if the columns can't answer it."""
+        ops = condition if isinstance(condition, dict) else {'$eq': condition}
+        mask = np.ones(size, dtype=bool)
+
+        if field == ID_FIELD and len(ops) == 1 and next(iter(ops)) in ('$eq', '$in'):
+            op, expected = next(iter(ops.items()))
+            wanted = [expected] if op == '$eq' else expected
+            rows = self._rows_for_ids([i for i in wanted if isinstance(i, str)])
+            mask[:] = False
+            mask[[row for row in rows if row < size]] = True
+            return mask
+
+        if field in self._categorical and self._column_exact[field]:
+            codes = self._categorical[field][:size]
+            vocab = self._vocab[field]
+
+            def code_of(value):
+                if value is None:
+                    return MISSING_CODE
+                return vocab.get(value, UNKNOWN_CODE) if isinstance(value, str) else None
+
+            for op, expected in ops.items():
+                if op in ('$eq', '$ne'):
+                    code = code_of(expected)
+                    if code is None:
+                        return None
+                    hit = codes == code
+                elif op in ('$in', '$nin'):
+                    wanted = [code_of(value) for value in expected]
+                    if any(code is None for code in wanted):
+                        return None
+                    hit = np.isin(codes, wanted)
+                else:
+                    return None
+                mask &= hit if op in ('$eq', '$in') else ~hit
+            return mask
+
+        if field in self._numeric and self._column_exact[field]:
+            values = self._numeric[field][:size]
+            for op, expected in ops.items():
+                if op in ('$eq', '$ne'):
+                    if expected is None:
+                        hit = np.isnan(values)
+                    elif _as_number(expected) is None:
+                        return None
+                    else:
+                        hit = values == _as_number(expected)
+                    mask &= hit if op == '$eq' else ~hit
+                elif op in ('$in', '$nin'):
+                    numbers = [_as_number(value) for value in expected]
+                    if any(number is None for number in numbers):
+                        return None
+                    hit = np.isin(values, numbers)
+                    mask &= hit if op == '$in' else ~hit
+                elif op in ('$gt', '$gte', '$lt', '$lte'):
+                    number = _as_number(expected)
+                    if number is None:
+                        return None
+                    # Missing values are NaN and compare False, like None in matches_where
+                    with np.errstate(invalid='ignore'):
+                        if op == '$gt':
+                            mask &= values > number
+                        elif op == '$gte':
+                            mask &= values >= number
+                        elif op == '$lt':
+                            mask &= values < number
+                        else:
+                            mask &= values <= number
+                else:
+                    return None
+            return mask
+
+        return None
+
+    def _where_mask(self, where: Dict[str, Any], size: int) -> np.ndarray:
+        """Evaluate a Chroma-style where clause over the first size rows."""
+        mask = np.ones(size, dtype=bool)
+        for key, condition in where.items():
+            if key == '$and':
+                for clause in condition:
+                    mask &= self._where_mask(clause, size)
+            elif key == '$or':
+                any_clause = np.zeros(size, dtype=bool)
+                for clause in condition:
+                    any_clause |= self._where_mask(clause, size)
+                mask &= any_clause
+            else:
+                column = self._column_mask(key, condition, size)
+                if column is None:
+                    column = np.fromiter(
+                        (_match_condition(metadata or {}, key, condition) for metadata in self._metadata_rows(size)),
+                        dtype=bool, count=size
+                    )
+                mask &= column
+        return mask
+
+    def _metadata_rows(self, size: int) -> List[Optional[Dict[str, Any]]]:
+        """Metadata of the first size rows, for conditions the columns can't answer."""
+        if not self._lazy:
+            return self._metadatas[:size]
+        metadatas: List[Optional[Dict[str, Any]]] = [None] * size
+        for row, metadata in self._conn.execute("SELECT row, metadata FROM records WHERE row < ?", (size,)):
+            metadatas[row] = json.loads(metadata)
+        return metadatas
+
+    def _rows_for_ids(self, ids: List[str]) -> List[int]:
+        """Rows of the given ids that exist, in the order of ids."""
+        if not self._lazy:
+            return [self._row_by_id[i] for i in ids if i in self._row_by_id]
+        found = {}
+        for start in range(0, len(ids), SQL_BATCH_ROWS):
+            batch = ids[start:start + SQL_BATCH_ROWS]
+            placeholders = ','.join('?' * len(batch))
+            found.update(self._conn.execute(
+                f"SELECT id, row FROM records WHERE id IN ({placeholders})", batch
+            ).fetchall())
+        return [found[i] for i in ids if i in found]
+
+    def _fetch_rows(self, rows: List[int]) -> Dict[int, Tuple[str, str, Dict[str, Any]]]:
+        """Read (id, text, metadata) for rows from records.db."""
+        records = {}
+        for start in range(0, len(rows), SQL_BATCH_ROWS):
+            batch = [int(row) for row in rows[start:start + SQL_BATCH_ROWS]]
+            placeholders = ','.join('?' * len(batch))
+            for row, record_id, text, metadata in self._conn.execute(
+                f"SELECT row, id, text, metadata FROM records WHERE row IN ({placeholders})", batch
+            ):
+                records[row] = (record_id, text, json.loads(metadata))
+        return records
+
+    def _write_header(self) -> None:
+        tmp_path = self._header_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'dtype': self.dtype, 'dim': self.dim, 'capacity': self.capacity, 'size': self.size}, f)
+        os.replace(tmp_path, self._header_path)
+
+    def _allocate(self, name: str, dtype, shape: Tuple[int, ...], old=None, keep_rows: int = 0):
+        """Create a new memory-mapped array, copying rows from the old one, and swap it in."""
+        tmp_path = self._path(name) + ".tmp"
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+        if old is not None and keep_rows:
+            array[:keep_rows] = old[:keep_rows]
+        array.flush()
+        del array
+        os.replace(tmp_path, self._path(name))
+        return np.load(self._path(name), mmap_mode='r+')
+
+    def _ensure_capacity(self, rows_needed: int) -> None:
+        if rows_needed <= self.capacity:
+            return
+        new_capacity = max(1024, self.capacity * 2)
+        while new_capacity < rows_needed:
+            new_capacity *= 2
+
+        self._vectors = self._allocate("vectors", self.dtype, (new_capacity, self.dim), self._vectors, self.size)
+        if self.dtype == 'int8':
+            self._scales = self._allocate("scales", np.float32, (new_capacity,), self._scales, self.size)
+        if self.rescore:
+            self._full = self._allocate("full", np.float32, (new_capacity, self.dim), self._full, self.size)
+        valid = np.zeros(new_capacity, dtype=bool)
+        valid[:self.size] = self._valid[:self.size]
+        self._valid = valid
+        self._resize_columns(new_capacity)
+        self.capacity = new_capacity
+
+    def _quantize(self, vectors: np.ndarray):
+        """Convert unit float32 rows to the storage dtype, returning (rows, scales)."""
+        if self.dtype == 'float32':
+            return vectors, None
+        if self.dtype == 'float16':
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_texts(self, texts: List[str], metadatas: List[Dict[str, Any]] = None, ids: List[str] = None) -> List[str]:
+        """Embed and append texts. Existing ids are replaced."""
+        self._check_writable()
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"row-{self.size + i}" for i in range(len(texts))]
+        vectors = self._normalize(self.embedding_function.embed_documents(texts))
+
+        with self._lock:
+            self.delete(ids=[i for i in ids if i in self._row_by_id])
+            if not self.dim:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+            start = self.size
+            end = start + len(texts)
+            self._ensure_capacity(end)
+
+            rows, scales = self._quantize(vectors)
+            self._vectors[start:end] = rows
+            if scales is not None:
+                self._scales[start:end] = scales
+            if self.rescore:
+                self._full[start:end] = vectors
+            for array in (self._vectors, self._scales, self._full):
+                if array is not None:
+                    array.flush()
+
+            self._conn.executemany(
+                "INSERT INTO records (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                [(start + i, ids[i], texts[i], json.dumps(metadatas[i])) for i in range(len(texts))]
+            )
+            self._conn.commit()
+
+            self.size = end
+            self._write_header()
+            self._ids.extend(ids)
+            self._metadatas.extend(metadatas)
+            self._valid[start:end] = True
+            for i, record_id in enumerate(ids):
+                self._row_by_id[record_id] = start + i
+                self._set_columns(start + i, metadatas[i])
+        return ids
+
+    def delete(self, ids: List[str] = None) -> None:
+        """Tombstone rows by id, compacting once enough of the matrix is dead."""
+        if not ids:
+            return
+        self._check_writable()
+        with self._lock:
+            rows = [self._row_by_id.pop(record_id) for record_id in ids if record_id in self._row_by_id]
+            if not rows:
+                return
+            self._valid[rows] = False
+            for row in rows:
+                self._ids[row] = None
+                self._metadatas[row] = None
+            self._conn.executemany("DELETE FROM records WHERE row = ?", [(row,) for row in rows])
+            self._conn.commit()
+
+            dead = self.size - len(self._row_by_id)
+            if self.size and dead / self.size >= self.compact_ratio:
+                self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the matrices without tombstoned rows."""
+        self._check_writable()
+        with self._lock:
+            keep = np.flatnonzero(self._valid[:self.size])
+            capacity = max(1024, len(keep))
+
+            def rewrite(name, old, dtype, shape):
+                tmp_path = self._path(name) + ".tmp"
+                array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+                if len(keep):
+                    array[:len(keep)] = old[keep]
+                array.flush()
+                del array
+                with open(tmp_path, 'rb+') as f:
+                    os.fsync(f.fileno())
+                return tmp_path
+
+            # 1. Stage complete, durable copies of the matrices
+            staged = {'vectors': rewrite("vectors", self._vectors, self.dtype, (capacity, self.dim))}
+            if self.dtype == 'int8':
+                staged['scales'] = rewrite("scales", self._scales, np.float32, (capacity,))
+            if self.rescore:
+                staged['full'] = rewrite("full", self._full, np.float32, (capacity, self.dim))
+
+            # 2. Commit the renumbering together with a marker; from here on a
+            #    crash is rolled forward by _recover_compaction on the next open
+            self._conn.executemany(
+                "UPDATE records SET row = ? WHERE id = ?",
+                [(-1 - new_row, self._ids[old_row]) for new_row, old_row in enumerate(keep)]
+            )
+            self._conn.execute("UPDATE records SET row = -1 - row WHERE row < 0")
+            self._conn.execute("DELETE FROM compaction")
+            self._conn.execute("INSERT INTO compaction (size, capacity) VALUES (?, ?)", (len(keep), capacity))
+            self._conn.commit()
+
+            # 3. Swap the files in, then clear the marker
+            for name, tmp_path in staged.items():
+                os.replace(tmp_path, self._path(name))
+            self.size = len(keep)
+            self.capacity = capacity
+            self._write_header()
+            self._conn.execute("DELETE FROM compaction")
+            self._conn.commit()
+            self._resize_columns(capacity, keep)
+
+            self._vectors = np.load(self._path("vectors"), mmap_mode='r+')
+            self._scales = np.load(self._path("scales"), mmap_mode='r+') if self.dtype == 'int8' else None
+            self._full = np.load(self._path("full"), mmap_mode='r+') if self.rescore else None
+            self._ids = [self._ids[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._valid = np.zeros(capacity, dtype=bool)
+            self._valid[:self.size] = True
+            self._row_by_id = {record_id: row for row, record_id in enumerate(self._ids)}
+
+    def export_snapshot(self, dest_dir: str) -> int:
+        """Write a compacted, self-contained copy of the live rows to dest_dir.
+
+        The copy is a normal index directory with exact-size matrices and a
+        rollback-journal records.db, suitable for opening with read_only=True.
+        Returns the number of rows written.
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        with self._lock:
+            keep = np.flatnonzero(self._valid[:self.size])
+            rows = max(len(keep), 1)
+            arrays = [("vectors", self._vectors, self.dtype, (rows, self.dim))]
+            if self.dtype == 'int8':
+                arrays.append(("scales", self._scales, np.float32, (rows,)))
+            if self.rescore:
+                arrays.append(("full", self._full, np.float32, (rows, self.dim)))
+            for name, old, dtype, shape in arrays:
+                array = np.lib.format.open_memmap(os.path.join(dest_dir, f"{name}.npy"), mode='w+', dtype=dtype, shape=shape)
+                if len(keep):
+                    array[:len(keep)] = old[keep]
+                array.flush()
+                del array
+
+            conn = sqlite3.connect(os.path.join(dest_dir, "records.db"))
+            try:
+                conn.executescript(RECORDS_SCHEMA)
+                for start in range(0, len(keep), 1000):
+                    batch = [int(row) for row in keep[start:start + 1000]]
+                    placeholders = ','.join('?' * len(batch))
+                    texts = dict(self._conn.execute(
+                        f"SELECT row, text FROM records WHERE row IN ({placeholders})", batch
+                    ).fetchall())
+                    conn.executemany(
+                        "INSERT INTO records (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                        [
+                            (start + i, self._ids[row], texts.get(row, ''), json.dumps(self._metadatas[row]))
+                            for i, row in enumerate(batch)
+                        ]
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+
+            # Filter columns travel with the snapshot, so readers map them
+            # instead of parsing every row's metadata
+            for columns in (self._categorical, self._numeric):
+                for field, column in columns.items():
+                    array = np.lib.format.open_memmap(
+                        os.path.join(dest_dir, f"column_{field}.npy"), mode='w+', dtype=column.dtype, shape=(rows,)
+                    )
+                    array[:] = MISSING_CODE if column.dtype == np.int32 else np.nan
+                    if len(keep):
+                        array[:len(keep)] = column[keep]
+                    array.flush()
+                    del array
+            with open(os.path.join(dest_dir, COLUMNS_FILE), 'w') as f:
+                json.dump({
+                    'vocab': {
+                        field: sorted(vocab, key=vocab.get) for field, vocab in self._vocab.items()
+                    },
+                    'exact': self._column_exact
+                }, f)
+
+            with open(os.path.join(dest_dir, "header.json"), 'w') as f:
+                json.dump({'dtype': self.dtype, 'dim': self.dim, 'capacity': rows, 'size': len(keep)}, f)
+            return len(keep)
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of existing rows without touching their vectors."""
+        self._check_writable()
+        with self._lock:
+            updates = [(json.dumps(m), i) for i, m in zip(ids, metadatas) if i in self._row_by_id]
+            self._conn.executemany("UPDATE records SET metadata = ? WHERE id = ?", updates)
+            self._conn.commit()
+            for record_id, metadata in zip(ids, metadatas):
+                row = self._row_by_id.get(record_id)
+                if row is not None:
+                    self._metadatas[row] = metadata
+                    self._set_columns(row, metadata)
+
+    def count(self) -> int:
+        """Return the number of live rows."""
+        return self.size if self._lazy else len(self._row_by_id)
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None, include: List[str] = None) -> Dict[str, List]:
+        """Return ids (and metadatas / documents if requested) of live rows matching the filters."""
+        include = include if include is not None else ['metadatas', 'documents']
+        with self._lock:
+            if ids is not None:
+                rows = self._rows_for_ids(list(ids))
+            else:
+                valid = self._valid[:self.size]
+                if where:
+                    valid = valid & self._where_mask(where, self.size)
+                rows = np.flatnonzero(valid).tolist()
+            rows.sort()
+            if self._lazy:
+                records = self._fetch_rows(rows)
+                result = {'ids': [records[row][0] for row in rows]}
+                if 'metadatas' in include:
+                    result['metadatas'] = [records[row][2] for row in rows]
+                if 'documents' in include:
+                    result['documents'] = [records[row][1] for row in rows]
+                return result
+            result = {'ids': [self._ids[row] for row in rows]}
+            if 'metadatas' in include:
+                result['metadatas'] = [self._metadatas[row] for row in rows]
+            if 'documents' in include:
+                result['documents'] = self._texts(rows)
+        return result
+
+    def _texts_by_id(self, ids: List[str]) -> Dict[str, str]:
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        return dict(self._conn.execute(
+            f"SELECT id, text FROM records WHERE id IN ({placeholders})", ids
+        ).fetchall())
+
+    def _texts(self, rows: List[int]) -> List[str]:
+        if not rows:
+            return []
+        placeholders = ','.join('?' * len(rows))
+        texts = dict(self._conn.execute(
+            f"SELECT row, text FROM records WHERE row IN ({placeholders})", rows
+        ).fetchall())
+        return [texts.get(row, '') for row in rows]
+
+    def _score(self, query: np.ndarray, vectors, scales, size: int) -> np.ndarray:
+        """Cosine similarity of the query against every stored row, block by block."""
+        scores = np.empty(size, dtype=np.float32)
+        for start in range(0, size, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, size)
+            block = vectors[start:end]
+            if block.dtype != np.float32:
+                block = block.astype(np.float32)
+            scores[start:end] = block @ query
+            if scales is not None:
+                scores[start:end] *= scales[start:end]
+        return scores
+
+    def _score_rows(self, query: np.ndarray, vectors, scales, rows: np.ndarray) -> np.ndarray:
+        """Cosine similarity against selected rows, gathering at most one block at a time."""
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, len(rows))
+            block_rows = rows[start:end]
+            scores[start:end] = np.asarray(vectors[block_rows], dtype=np.float32) @ query
+            if scales is not None:
+                scores[start:end] *= scales[block_rows]
+        return scores
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4,
+                                               filter: Dict[str, Any] = None) -> List[Tuple[Document, float]]:
+        """Exact top-k by cosine similarity, with the filter applied before scoring."""
+        query = self._normalize(embedding)
+        with self._lock:
+            # Hold references so a concurrent grow/compact cannot swap arrays mid-query
+            vectors, scales, full = self._vectors, self._scales, self._full
+            size = self.size
+            valid = self._valid[:size].copy()
+            if filter:
+                valid &= self._where_mask(filter, size)
+            ids = self._ids
+            metadatas = self._metadatas
+
+        candidates = np.flatnonzero(valid)
+        if not len(candidates) or vectors is None:
+            return []
+
+        # Tombstones and broad filters scan the mapped matrix in blocks; copying
+        # every candidate row out of the map would cost RAM per query
+        if len(candidates) <= GATHER_FRACTION * size:
+            scores = self._score_rows(query, vectors, scales, candidates)
+            row_of = candidates
+        else:
+            scores = self._score(query, vectors, scales, size)
+            scores[~valid] = -np.inf
+            row_of = None
+
+        # Select candidates with argpartition, then sort only the survivors
+        shortlist = min(len(candidates), k * self.rescore_factor if full is not None else k)
+        top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+        rows = top if row_of is None else row_of[top]
+        top_scores = scores[top]
+
+        if full is not None:
+            top_scores = np.asarray(full[rows]) @ query
+
+        order = np.argsort(-top_scores)[:k]
+        rows = rows[order]
+        top_scores = top_scores[order]
+
+        if self._lazy:
+            # A read-only snapshot never renumbers its rows
+            with self._lock:
+                records = self._fetch_rows(rows.tolist())
+            return [
+                (Document(page_content=records[row][1], metadata=records[row][2]), float(2.0 - 2.0 * score))
+                for row, score in zip(rows.tolist(), top_scores)
+                if row in records
+            ]
+
+        # Row numbers may have been reassigned by a compaction since the lock was
+        # released, so texts are looked up by the ids captured with the rows
+        row_ids = [ids[row] for row in rows]
+        with self._lock:
+            texts = self._texts_by_id([record_id for record_id in row_ids if record_id is not None])
+        return [
+            (Document(page_content=texts[record_id], metadata=metadatas[row] or {}), float(2.0 - 2.0 * score))
+            for row, record_id, score in zip(rows, row_ids, top_scores)
+            if record_id in texts
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Dict[str, Any] = None) -> List[Tuple[Document, float]]:
+        """Embed the query and return (Document, distance) pairs, lowest distance first."""
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Bytes used on disk (and in page cache when hot) by each matrix."""
+        usage = {}
+        for name, array in (('vectors', self._vectors), ('scales', self._scales), ('full', self._full)):
+            if array is not None:
+                usage[name] = int(array[:self.size].nbytes)
+        return usage
+
+    def close(self) -> None:
+        """Flush and release the memory maps and records database."""
+        with self._lock:
+            for array in (self._vectors, self._scales, self._full):
+                if array is not None and not self.read_only:
+                    array.flush()
+            self._vectors = self._scales = self._full = None
+            self._conn.close()
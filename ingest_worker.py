@@ -0,0 +1,60 @@
+from embedder import get_tenant_manager
+from pdf_watcher import PDFWatcher
+import logging
+import os
+import signal
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# The ingestion owner always writes the flat index and publishes snapshots,
+# even when it shares an env file with the serving workers
+os.environ["REAIC_ROLE"] = "ingest"
+os.environ["VECTOR_BACKEND"] = "flat"
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def main():
+    """Run the single ingestion owner for every tenant of a multi-worker deployment.
+
+    Serving workers attach to each tenant's published snapshots, so the owner
+    ingests and publishes all configured tenants and tenants already on disk,
+    not just the default one. Tenants added to TENANT_API_KEYS later are
+    picked up on restart.
+    """
+    manager = get_tenant_manager()
+    tenants = manager.known_tenants()
+    # Keep every tenant (and its watcher) open; nothing else in this process uses the manager
+    manager.max_open = max(manager.max_open, len(tenants))
+
+    watchers = []
+    for tenant_id in tenants:
+        embedder = manager.get(tenant_id)
+        pdf_dir = embedder.pdf_dir
+        os.makedirs(pdf_dir, exist_ok=True)
+
+        # Catch up on anything added while no owner was running, then publish at least once
+        embedder.process_new_pdfs(pdf_dir)
+        embedder.publish_snapshot(force=not os.path.exists(os.path.join(embedder.snapshot_root, "CURRENT")))
+
+        watcher = PDFWatcher(embedder, pdf_dir=pdf_dir)
+        watcher.start()
+        watchers.append(watcher)
+        logger.info(f"Ingestion owner watching {pdf_dir} for tenant {tenant_id}, publishing to {embedder.snapshot_root}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    stop.wait()
+
+    for watcher in watchers:
+        watcher.stop()
+    for tenant_id in tenants:
+        manager.get(tenant_id).close()
+
+if __name__ == "__main__":
+    main()
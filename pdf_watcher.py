@@ -0,0 +1,167 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Set, Tuple
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # Not on Linux or package not installed
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+class PDFWatcher:
+    def __init__(self, embedder, pdf_dir: str = "pdf_files", debounce_seconds: float = 2.0,
+                 poll_interval: float = 5.0, use_inotify: bool = True):
+        """Watch a PDF directory and feed changed files to the embedder."""
+        self.embedder = embedder
+        self.pdf_dir = pdf_dir
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and INotify is not None
+
+        # filename -> monotonic time of the last event seen for it
+        self._pending: Dict[str, float] = {}
+        self._pending_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._snapshot: Dict[str, Tuple[float, int]] = {}
+
+    @property
+    def mode(self) -> str:
+        """Return the change detection backend in use."""
+        return "inotify" if self.use_inotify else "polling"
+
+    def start(self) -> None:
+        """Start watching in a background daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        self._stop_event.clear()
+        self._snapshot = self._take_snapshot()
+        target = self._run_inotify if self.use_inotify else self._run_polling
+        self._thread = threading.Thread(target=target, name="pdf-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.pdf_dir} for PDF changes ({self.mode})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the watcher thread; pending events are dropped."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _is_pdf(self, filename: str) -> bool:
+        return filename.lower().endswith('.pdf')
+
+    def _take_snapshot(self) -> Dict[str, Tuple[float, int]]:
+        """Stat every PDF in the directory without reading file contents."""
+        snapshot = {}
+        try:
+            with os.scandir(self.pdf_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and self._is_pdf(entry.name):
+                        stat = entry.stat()
+                        snapshot[entry.name] = (stat.st_mtime, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return snapshot
+
+    def _mark(self, filenames) -> None:
+        """Record events for files; repeated events push the debounce deadline back."""
+        now = time.monotonic()
+        with self._pending_lock:
+            for filename in filenames:
+                if self._is_pdf(filename):
+                    self._pending[filename] = now
+
+    def _due(self) -> Set[str]:
+        """Pop files whose events have been quiet for the debounce window."""
+        cutoff = time.monotonic() - self.debounce_seconds
+        with self._pending_lock:
+            ready = {name for name, seen in self._pending.items() if seen <= cutoff}
+            for name in ready:
+                del self._pending[name]
+        return ready
+
+    def _apply(self, filenames: Set[str]) -> None:
+        """Reconcile each affected file against the index by its current state on disk.
+
+        The stat snapshot is updated for every applied file, so in inotify mode
+        an overflow resync compares against what was last ingested rather than
+        the state at startup.
+        """
+        for filename in sorted(filenames):
+            file_path = os.path.join(self.pdf_dir, filename)
+            try:
+                # Stat before ingesting, so a write during processing still shows up as a change
+                stat = os.stat(file_path)
+                self._snapshot[filename] = (stat.st_mtime, stat.st_size)
+            except FileNotFoundError:
+                self._snapshot.pop(filename, None)
+            try:
+                if os.path.isfile(file_path):
+                    self.embedder.process_file(file_path)
+                else:
+                    logger.info(f"{filename} removed from {self.pdf_dir}, dropping from index")
+                    self.embedder.remove_document(filename)
+            except Exception as e:
+                logger.error(f"Error syncing {filename}: {str(e)}")
+        try:
+            # Ingestion owners hand the updated index to serving workers
+            self.embedder.publish_snapshot()
+        except Exception as e:
+            logger.error(f"Error publishing snapshot: {str(e)}")
+
+    def _diff_snapshot(self) -> None:
+        """Mark files whose stat signature changed since the last snapshot."""
+        current = self._take_snapshot()
+        changed = {
+            name for name in current.keys() | self._snapshot.keys()
+            if current.get(name) != self._snapshot.get(name)
+        }
+        self._snapshot = current
+        if changed:
+            self._mark(changed)
+
+    def _run_polling(self) -> None:
+        tick = min(self.poll_interval, max(self.debounce_seconds, 0.1))
+        next_poll = 0.0
+        while not self._stop_event.is_set():
+            if time.monotonic() >= next_poll:
+                self._diff_snapshot()
+                next_poll = time.monotonic() + self.poll_interval
+            due = self._due()
+            if due:
+                self._apply(due)
+            self._stop_event.wait(tick)
+
+    def _run_inotify(self) -> None:
+        watch_flags = (
+            flags.CLOSE_WRITE | flags.MOVED_FROM | flags.MOVED_TO |
+            flags.DELETE | flags.CREATE | flags.MODIFY
+        )
+        try:
+            inotify = INotify()
+            inotify.add_watch(self.pdf_dir, watch_flags)
+        except OSError as e:
+            logger.warning(f"inotify unavailable ({str(e)}), falling back to polling")
+            self.use_inotify = False
+            self._run_polling()
+            return
+
+        timeout_ms = int(max(self.debounce_seconds, 0.1) * 1000)
+        try:
+            while not self._stop_event.is_set():
+                events = inotify.read(timeout=timeout_ms)
+                # A rename shows up as MOVED_FROM(old) + MOVED_TO(new); both names are marked
+                self._mark(event.name for event in events if event.name)
+                if any(event.mask & flags.Q_OVERFLOW for event in events):
+                    logger.warning("inotify queue overflow, resyncing from directory stat")
+                    self._diff_snapshot()
+                due = self._due()
+                if due:
+                    self._apply(due)
+        finally:
+            inotify.close()
@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable
+
+# Keyword -> document type, checked against the filename and first page
+DOCUMENT_TYPES = [
+    ('appraisal', ('appraisal', 'appraised value', 'uniform residential appraisal')),
+    ('inspection', ('inspection', 'inspector')),
+    ('lease', ('lease', 'lessee', 'tenant agrees')),
+    ('contract', ('purchase agreement', 'contract', 'offer to purchase', 'addendum')),
+    ('disclosure', ('disclosure',)),
+    ('title', ('title commitment', 'title report', 'title insurance')),
+    ('listing', ('listing', 'mls')),
+    ('market_report', ('market report', 'market analysis', 'cma', 'comparative market')),
+]
+
+# Words too common in filenames and questions to identify a document
+STOPWORDS = {
+    'a', 'an', 'and', 'the', 'of', 'in', 'on', 'for', 'to', 'at', 'by', 'with',
+    'pdf', 'doc', 'document', 'file', 'copy', 'final', 'draft', 'v1', 'v2', 'new'
+}
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Whole words only ("release" is not a lease, "contractor" not a contract);
+# an optional plural s is allowed
+DOCUMENT_TYPE_PATTERNS = [
+    (doc_type, re.compile(r'\b(?:' + '|'.join(r'\s+'.join(map(re.escape, k.split())) for k in keywords) + r')s?\b'))
+    for doc_type, keywords in DOCUMENT_TYPES
+]
+
+def detect_document_type(filename: str, first_page: str = "") -> str:
+    """Classify a document by whole-word keywords in its filename or opening text."""
+    # Underscores, dashes and dots separate words in filenames
+    haystack = ' '.join(TOKEN_PATTERN.findall(f"{filename} {first_page[:2000]}".lower()))
+    for doc_type, pattern in DOCUMENT_TYPE_PATTERNS:
+        if pattern.search(haystack):
+            return doc_type
+    return 'other'
+
+def _to_timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+def build_where_clause(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Translate search filters into a Chroma where clause.
+
+    Supported keys: source (str or list), document_type (str or list),
+    processed_after / processed_before (ISO date or epoch seconds),
+    page_from / page_to (chunks overlapping the page range).
+    """
+    if not filters:
+        return None
+
+    conditions = []
+    for key, field in (('source', 'source'), ('document_type', 'document_type')):
+        value = filters.get(key)
+        if not value:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            conditions.append({field: values[0]} if len(values) == 1 else {field: {'$in': values}})
+        else:
+            conditions.append({field: value})
+
+    if filters.get('processed_after') is not None:
+        conditions.append({'processed_ts': {'$gte': _to_timestamp(filters['processed_after'])}})
+    if filters.get('processed_before') is not None:
+        conditions.append({'processed_ts': {'$lte': _to_timestamp(filters['processed_before'])}})
+
+    # A chunk may span pages, so match any overlap with the requested range
+    if filters.get('page_from') is not None:
+        conditions.append({'page_end': {'$gte': int(filters['page_from'])}})
+    if filters.get('page_to') is not None:
+        conditions.append({'page': {'$lte': int(filters['page_to'])}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {'$and': conditions}
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+class FilenameIndex:
+    def __init__(self, filenames: Iterable[str] = (), min_coverage: float = 0.6):
+        """Inverted index from filename tokens to filenames for query-side source detection."""
+        self.min_coverage = min_coverage
+        self._tokens_by_file: Dict[str, set] = {}
+        self._files_by_token: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        for filename in filenames:
+            self.add(filename)
+
+    def add(self, filename: str) -> None:
+        """Index a filename (idempotent)."""
+        tokens = set(_tokens(os.path.splitext(filename)[0]))
+        if not tokens:
+            return
+        with self._lock:
+            self._discard(filename)
+            self._tokens_by_file[filename] = tokens
+            for token in tokens:
+                self._files_by_token.setdefault(token, set()).add(filename)
+
+    def remove(self, filename: str) -> None:
+        """Drop a filename from the index."""
+        with self._lock:
+            self._discard(filename)
+
+    def _discard(self, filename: str) -> None:
+        for token in self._tokens_by_file.pop(filename, ()):
+            files = self._files_by_token.get(token)
+            if files:
+                files.discard(filename)
+                if not files:
+                    del self._files_by_token[token]
+
+    def match(self, message: str) -> List[str]:
+        """Return filenames whose name is mentioned in the message, best match first.
+
+        A file matches when enough of its distinctive name tokens appear in the
+        message, and either two or more of them do or one of them is a number.
+        A one-word name such as report.pdf is too generic to match on its own.
+        If the name has numbers (street numbers, years), one of them must be
+        mentioned unless every word of the name is.
+        """
+        message_tokens = set(_tokens(message))
+        with self._lock:
+            hits: Dict[str, int] = {}
+            for token in message_tokens:
+                for filename in self._files_by_token.get(token, ()):
+                    hits[filename] = hits.get(filename, 0) + 1
+
+            scored = []
+            for filename, count in hits.items():
+                name_tokens = self._tokens_by_file[filename]
+                coverage = count / len(name_tokens)
+                numbers = {t for t in name_tokens if t.isdigit()}
+                words = name_tokens - numbers
+                specific = not numbers or numbers & message_tokens or words <= message_tokens
+                distinctive = count >= 2 or bool(numbers & message_tokens)
+                if coverage >= self.min_coverage and specific and distinctive:
+                    scored.append((bool(numbers & message_tokens), coverage, count, filename))
+
+        # When the message names a number, files matched on it win over the rest
+        if any(number_hit for number_hit, _, _, _ in scored):
+            scored = [entry for entry in scored if entry[0]]
+        scored.sort(reverse=True)
+        return [filename for _, _, _, filename in scored]
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable
+from flat_index import FlatVectorStore
+
+CURRENT_POINTER = "CURRENT"
+
+def _read_current(snapshot_root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(snapshot_root, CURRENT_POINTER), 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _versions(snapshot_root: str) -> List[str]:
+    if not os.path.isdir(snapshot_root):
+        return []
+    return sorted(name for name in os.listdir(snapshot_root) if name.startswith('v') and name[1:].isdigit())
+
+def publish_snapshot(store: FlatVectorStore, documents: Dict[str, Dict], snapshot_root: str, keep: int = None) -> str:
+    """Publish an immutable, versioned copy of a flat index and its tracking rows.
+
+    The snapshot is written to a temporary directory, renamed into place and
+    only then made current by atomically replacing the CURRENT pointer, so a
+    reader never sees a partially written version. Older versions beyond
+    keep (SNAPSHOT_KEEP, default 3) are removed; processes still mapping them
+    keep their open pages.
+
+    Snapshots are full copies, not deltas: every publish rewrites the whole
+    index, so its cost grows with the corpus, and the owner calls it once per
+    ingest batch or watcher flush. Disk use is about keep + 1 copies of the
+    index (the live one plus the kept versions).
+    """
+    if keep is None:
+        keep = int(os.getenv("SNAPSHOT_KEEP", "3"))
+    keep = max(1, keep)
+    os.makedirs(snapshot_root, exist_ok=True)
+    existing = _versions(snapshot_root)
+    version = f"v{(int(existing[-1][1:]) + 1 if existing else 1):06d}"
+    staging = os.path.join(snapshot_root, f".staging-{version}-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    rows = store.export_snapshot(staging)
+    with open(os.path.join(staging, "documents.json"), 'w') as f:
+        json.dump(documents, f)
+    with open(os.path.join(staging, "manifest.json"), 'w') as f:
+        json.dump({
+            'version': version,
+            'dtype': store.dtype,
+            'rows': rows,
+            'documents': len(documents),
+            'created': datetime.now().isoformat()
+        }, f)
+    os.rename(staging, os.path.join(snapshot_root, version))
+
+    pointer_tmp = os.path.join(snapshot_root, f".{CURRENT_POINTER}.{os.getpid()}")
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(snapshot_root, CURRENT_POINTER))
+
+    for old in _versions(snapshot_root)[:-keep]:
+        shutil.rmtree(os.path.join(snapshot_root, old), ignore_errors=True)
+
+    print(f"Published snapshot {version} ({rows} chunks, {len(documents)} documents) to {snapshot_root}")
+    return version
+
+class SnapshotVectorStore:
+    def __init__(self, snapshot_root: str, embedding_function, check_interval: float = 1.0):
+        """Read-only view of the newest published snapshot, hot-swapped when CURRENT changes.
+
+        Matrices and filter columns are mapped with mode 'r', so every worker
+        process shares the same page-cache pages; per-chunk metadata stays in
+        the snapshot's records.db and is read per result. A new version is
+        opened on a background thread and swapped in by replacing a single
+        reference, so no search waits on it; in-flight queries finish on the
+        snapshot they started with.
+        """
+        self.snapshot_root = snapshot_root
+        self.embedding_function = embedding_function
+        self.check_interval = check_interval
+        self.version = None
+        self._store: Optional[FlatVectorStore] = None
+        self._documents: Dict[str, Dict] = {}
+        self._last_check = 0.0
+        self._swap_lock = threading.Lock()
+        self._swap_callbacks: List[Callable[[], None]] = []
+        self.refresh(force=True, wait=True)
+
+    def on_swap(self, callback: Callable[[], None]) -> None:
+        """Register a callback run after a new snapshot becomes active."""
+        self._swap_callbacks.append(callback)
+
+    def refresh(self, force: bool = False, wait: bool = False) -> bool:
+        """Switch to the current snapshot if it changed.
+
+        The new version is loaded on a background thread unless wait is set,
+        in which case this returns True once it has been swapped in.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return False
+        if not self._swap_lock.acquire(blocking=False):
+            # Another thread is already loading a version; keep serving the old one
+            return False
+        self._last_check = now
+        version = _read_current(self.snapshot_root)
+        if version is None or version == self.version:
+            self._swap_lock.release()
+            return False
+        if wait:
+            return self._load(version)
+        threading.Thread(target=self._load, args=(version,), name="snapshot-loader", daemon=True).start()
+        return False
+
+    def _load(self, version: str) -> bool:
+        """Open a snapshot version and make it active. Releases the swap lock taken by refresh()."""
+        try:
+            path = os.path.join(self.snapshot_root, version)
+            with open(os.path.join(path, "manifest.json"), 'r') as f:
+                manifest = json.load(f)
+            with open(os.path.join(path, "documents.json"), 'r') as f:
+                documents = json.load(f)
+            store = FlatVectorStore(path, self.embedding_function, dtype=manifest['dtype'], read_only=True)
+
+            # The previous store is not closed here: queries that already hold it
+            # finish normally and its maps are released once they drop the reference
+            self._store, self._documents, self.version = store, documents, version
+            print(f"Serving snapshot {version} ({manifest['rows']} chunks)")
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            print(f"Error loading snapshot from {self.snapshot_root}: {str(e)}")
+            return False
+        finally:
+            self._swap_lock.release()
+
+        for callback in self._swap_callbacks:
+            callback()
+        return True
+
+    def documents(self) -> Dict[str, Dict]:
+        """Tracking rows that were published with the active snapshot."""
+        self.refresh()
+        return self._documents
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Dict[str, Any] = None):
+        self.refresh()
+        store = self._store
+        if store is None:
+            return []
+        return store.similarity_search_with_score(query, k=k, filter=filter)
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None, include: List[str] = None) -> Dict[str, List]:
+        self.refresh()
+        store = self._store
+        if store is None:
+            return {'ids': [], 'metadatas': [], 'documents': []}
+        return store.get(ids=ids, where=where, include=include)
+
+    def count(self) -> int:
+        self.refresh()
+        return self._store.count() if self._store is not None else 0
+
+    def add_texts(self, *args, **kwargs):
+        raise RuntimeError("Snapshot vector store is read-only; ingest through the owner process")
+
+    def delete(self, *args, **kwargs):
+        raise RuntimeError("Snapshot vector store is read-only; ingest through the owner process")
+
+    def close(self) -> None:
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+class SnapshotTrackingView:
+    def __init__(self, snapshot_store: SnapshotVectorStore):
+        """Read-only DocumentTrackingStore stand-in backed by the active snapshot."""
+        self._snapshot_store = snapshot_store
+
+    def get(self, filename: str) -> Optional[Dict]:
+        return self._snapshot_store.documents().get(filename)
+
+    def find_by_hash(self, file_hash: str) -> List[str]:
+        return [name for name, meta in self._snapshot_store.documents().items() if meta.get('hash') == file_hash]
+
+    def all(self) -> Dict[str, Dict]:
+        return dict(self._snapshot_store.documents())
+
+    def list_documents(self) -> List[Dict]:
+        rows = [{'filename': name, **meta} for name, meta in self._snapshot_store.documents().items()]
+        return sorted(rows, key=lambda row: row.get('processed_date', ''), reverse=True)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._snapshot_store.documents()
+
+    def __len__(self) -> int:
+        return len(self._snapshot_store.documents())
+
+    def close(self) -> None:
+        pass
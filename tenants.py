@@ -0,0 +1,283 @@
+import os
+import re
+import hmac
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+from embedding_text import PDFEmbedder
+from pdf_watcher import PDFWatcher
+
+DEFAULT_TENANT = "default"
+# Chroma collection names are 3-63 characters and must start and end with an
+# alphanumeric; "reaic_docs_" leaves 52 characters for the tenant id
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9](?:[a-z0-9_-]{0,50}[a-z0-9])?$')
+
+class UnknownTenantError(LookupError):
+    """Raised for a tenant that is neither configured nor already on disk."""
+
+def validate_tenant_id(tenant_id: str) -> str:
+    """Normalize a tenant id, raising ValueError for anything unsafe as a path or collection name."""
+    tenant_id = (tenant_id or DEFAULT_TENANT).strip().lower()
+    if not TENANT_ID_PATTERN.match(tenant_id):
+        raise ValueError(f"Invalid tenant id: {tenant_id!r}")
+    return tenant_id
+
+def load_tenant_keys(spec: str = None) -> Dict[str, str]:
+    """Parse TENANT_API_KEYS ("acme=key1,globex=key2") into {api key: tenant id}."""
+    spec = os.getenv("TENANT_API_KEYS", "") if spec is None else spec
+    keys = {}
+    for entry in spec.split(','):
+        if not entry.strip():
+            continue
+        tenant_id, _, api_key = entry.partition('=')
+        if not api_key.strip():
+            raise ValueError(f"TENANT_API_KEYS entry for {tenant_id.strip()!r} has no key")
+        keys[api_key.strip()] = validate_tenant_id(tenant_id)
+    return keys
+
+class _Shard:
+    def __init__(self, tenant_id: str, embedder: PDFEmbedder):
+        """A loaded tenant index plus the requests currently using it."""
+        self.tenant_id = tenant_id
+        self.embedder = embedder
+        self.refs = 0
+        self.retired = False
+        self.closed = False
+        self.watcher: Optional[PDFWatcher] = None
+
+class TenantIndexManager:
+    def __init__(self, vector_db_path="vector_db", pdf_root="pdf_files", max_open=8, api_keys=None):
+        """Route tenants to their own collections, keeping at most max_open loaded.
+
+        The default tenant uses the original reaic_docs collection, tracking
+        store and pdf_files directory. Other tenants get reaic_docs_<tenant>
+        with their own Chroma directory and tracking under
+        vector_db/tenants/<tenant>/, and pdf_files/<tenant>/.
+
+        Only the default tenant, tenants named in api_keys (TENANT_API_KEYS)
+        and tenants already on disk can be opened. Requests use lease(), which
+        keeps an evicted shard open until its last user is done.
+        """
+        self.vector_db_path = vector_db_path
+        self.pdf_root = pdf_root
+        self.max_open = max(1, max_open)
+        self._api_keys = load_tenant_keys() if api_keys is None else api_keys
+        self._embeddings = None
+        self._open: "OrderedDict[str, _Shard]" = OrderedDict()
+        # Evicted shards still held by a lease; reopening the tenant takes them
+        # back, so there is never a second embedder over the same directories
+        self._retiring: Dict[str, _Shard] = {}
+        self._lock = threading.RLock()
+        self._auto_ingest = False
+        # Counters survive eviction so stats cover the whole process lifetime
+        self._retired_stats: Dict[str, Dict[str, Any]] = {}
+
+    def _shard_config(self, tenant_id: str) -> Dict[str, str]:
+        if tenant_id == DEFAULT_TENANT:
+            return {
+                'collection_name': "reaic_docs",
+                'tracking_dir': self.vector_db_path,
+                'pdf_dir': self.pdf_root
+            }
+        tracking_dir = os.path.join(self.vector_db_path, "tenants", tenant_id)
+        return {
+            'collection_name': f"reaic_docs_{tenant_id}",
+            'tracking_dir': tracking_dir,
+            'pdf_dir': os.path.join(self.pdf_root, tenant_id),
+            'chroma_path': os.path.join(tracking_dir, "chroma")
+        }
+
+    def configured_tenants(self) -> List[str]:
+        """Default tenant plus every tenant with an API key."""
+        return sorted({DEFAULT_TENANT, *self._api_keys.values()})
+
+    def known_tenants(self) -> List[str]:
+        """Configured tenants plus every tenant whose index already exists on disk."""
+        tenants = set(self.configured_tenants())
+        tenants_dir = os.path.join(self.vector_db_path, "tenants")
+        if os.path.isdir(tenants_dir):
+            for name in os.listdir(tenants_dir):
+                if TENANT_ID_PATTERN.match(name) and os.path.isdir(os.path.join(tenants_dir, name)):
+                    tenants.add(name)
+        return sorted(tenants)
+
+    def tenant_exists(self, tenant_id: str) -> bool:
+        """True if the tenant is configured or its index already exists on disk."""
+        tenant_id = validate_tenant_id(tenant_id)
+        return (
+            tenant_id in self.configured_tenants() or
+            os.path.isdir(os.path.join(self.vector_db_path, "tenants", tenant_id))
+        )
+
+    def authenticate(self, api_key: str) -> Optional[str]:
+        """Return the tenant an API key belongs to, or None."""
+        if not api_key:
+            return None
+        tenant = None
+        for known_key, tenant_id in self._api_keys.items():
+            # Compare against every key so timing does not reveal which one matched
+            if hmac.compare_digest(known_key.encode(), api_key.encode()):
+                tenant = tenant_id
+        return tenant
+
+    def _create(self, tenant_id: str) -> PDFEmbedder:
+        embedder = PDFEmbedder(
+            vector_db_path=self.vector_db_path,
+            embeddings=self._embeddings,
+            **self._shard_config(tenant_id)
+        )
+        # All shards share one embeddings client
+        self._embeddings = embedder.embeddings
+        return embedder
+
+    def _open_shard(self, tenant_id: str) -> _Shard:
+        tenant_id = validate_tenant_id(tenant_id)
+        shard = self._open.get(tenant_id)
+        if shard is not None:
+            self._open.move_to_end(tenant_id)
+            return shard
+
+        shard = self._retiring.pop(tenant_id, None)
+        if shard is not None:
+            shard.retired = False
+            self._open[tenant_id] = shard
+            return shard
+
+        if not self.tenant_exists(tenant_id):
+            raise UnknownTenantError(f"Unknown tenant: {tenant_id}")
+        shard = _Shard(tenant_id, self._create(tenant_id))
+        self._open[tenant_id] = shard
+        if self._auto_ingest:
+            self._start_ingest(shard)
+        return shard
+
+    def get(self, tenant_id: str = DEFAULT_TENANT) -> PDFEmbedder:
+        """Return the tenant's embedder without holding it open.
+
+        Only safe to keep for the pinned default tenant; request handlers
+        should use lease() so eviction cannot close the shard under them.
+        """
+        with self._lock:
+            shard = self._open_shard(tenant_id)
+            to_close = self._evict()
+        self._close_all(to_close)
+        return shard.embedder
+
+    @contextmanager
+    def lease(self, tenant_id: str = DEFAULT_TENANT):
+        """Yield the tenant's embedder, keeping it open until the block exits."""
+        with self._lock:
+            shard = self._open_shard(tenant_id)
+            shard.refs += 1
+            to_close = self._evict()
+        self._close_all(to_close)
+        try:
+            yield shard.embedder
+        finally:
+            self._release(shard)
+
+    def _release(self, shard: _Shard) -> None:
+        with self._lock:
+            shard.refs -= 1
+            close = shard.retired and shard.refs == 0 and not shard.closed
+            if close:
+                shard.closed = True
+                self._retiring.pop(shard.tenant_id, None)
+        if close:
+            self._close(shard)
+
+    def _evict(self) -> List[_Shard]:
+        """Retire least recently used shards beyond max_open. The default tenant stays pinned.
+
+        Returns the retired shards nobody is using, to be closed outside the
+        lock; the rest wait in _retiring and are closed by the last lease to
+        release them, unless the tenant is reopened first.
+        """
+        to_close = []
+        while len(self._open) > self.max_open:
+            victim = next((t for t in self._open if t != DEFAULT_TENANT), None)
+            if victim is None:
+                break
+            shard = self._open.pop(victim)
+            shard.retired = True
+            if shard.refs == 0:
+                shard.closed = True
+                to_close.append(shard)
+            else:
+                self._retiring[victim] = shard
+        return to_close
+
+    def _close_all(self, shards: List[_Shard]) -> None:
+        for shard in shards:
+            self._close(shard)
+
+    def _close(self, shard: _Shard) -> None:
+        if shard.watcher is not None:
+            shard.watcher.stop()
+        with self._lock:
+            self._retire_stats(shard.tenant_id, shard.embedder)
+        try:
+            shard.embedder.close()
+        except Exception as e:
+            print(f"Error closing shard for tenant {shard.tenant_id}: {str(e)}")
+
+    def enable_auto_ingest(self) -> None:
+        """Scan and watch each tenant's PDF directory from the moment it is loaded.
+
+        Call this only in the process that owns ingestion (not in serve-only
+        workers, and once per development-server reload).
+        """
+        with self._lock:
+            self._auto_ingest = True
+            for shard in self._open.values():
+                if shard.watcher is None:
+                    self._start_ingest(shard)
+
+    def _start_ingest(self, shard: _Shard) -> None:
+        """Watch the shard's PDF directory and ingest what is already there, in the background."""
+        embedder = shard.embedder
+        if embedder.read_only:
+            return
+        # Held like a lease so eviction waits for the initial scan to finish
+        shard.refs += 1
+        shard.watcher = PDFWatcher(embedder, pdf_dir=embedder.pdf_dir)
+
+        def scan():
+            try:
+                # Watch first so files arriving during the scan are not missed
+                shard.watcher.start()
+                embedder.process_new_pdfs()
+            except Exception as e:
+                print(f"Error ingesting PDFs for tenant {shard.tenant_id}: {str(e)}")
+            finally:
+                self._release(shard)
+
+        threading.Thread(target=scan, name=f"ingest-{shard.tenant_id}", daemon=True).start()
+
+    def _retire_stats(self, tenant_id: str, embedder) -> None:
+        retired = self._retired_stats.setdefault(tenant_id, {})
+        for key, value in embedder.stats.items():
+            retired[key] = retired.get(key, 0) + value
+
+    def loaded_tenants(self) -> List[str]:
+        """Return currently open tenants, least recently used first."""
+        with self._lock:
+            return list(self._open)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-tenant ingest and search stats for loaded and previously evicted tenants."""
+        with self._lock:
+            stats = {}
+            for tenant_id, retired in self._retired_stats.items():
+                stats[tenant_id] = {**retired, 'loaded': False}
+            for tenant_id, shard in [*self._retiring.items(), *self._open.items()]:
+                current = shard.embedder.get_stats()
+                for key, value in self._retired_stats.get(tenant_id, {}).items():
+                    current[key] = current.get(key, 0) + value
+                current['loaded'] = True
+                stats[tenant_id] = current
+            for entry in stats.values():
+                searches = entry.get('searches', 0)
+                entry['avg_search_ms'] = 1000 * entry.get('search_seconds', 0.0) / searches if searches else 0.0
+            return stats
@@ -0,0 +1,119 @@
+import re
+import numpy as np
+import tiktoken
+from typing import List, Dict, Any
+
+# Sentence ends: terminal punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_BOUNDARY = re.compile(r'[.!?]+["\')\]]*\s+')
+
+class TokenChunker:
+    def __init__(self, chunk_tokens: int = 300, overlap_tokens: int = 50, encoding_name: str = "cl100k_base"):
+        """Initialize a sentence-aware chunker with tiktoken budgets."""
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def _sentence_offsets(self, text: str) -> np.ndarray:
+        """Return the start offset of every sentence plus the end of the text."""
+        starts = [0] + [m.end() for m in SENTENCE_BOUNDARY.finditer(text)]
+        if starts[-1] != len(text):
+            starts.append(len(text))
+        return np.asarray(starts, dtype=np.int64)
+
+    def _segments(self, text: str):
+        """Compute segment offsets and token counts, hard-splitting oversized sentences."""
+        offsets = self._sentence_offsets(text)
+        sentences = [text[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        encoded = self.encoding.encode_ordinary_batch(sentences)
+
+        starts, ends, counts = [], [], []
+        for i, tokens in enumerate(encoded):
+            start = int(offsets[i])
+            if len(tokens) <= self.chunk_tokens:
+                starts.append(start)
+                ends.append(int(offsets[i + 1]))
+                counts.append(len(tokens))
+                continue
+
+            # A single sentence exceeds the budget: cut it on token boundaries
+            _, token_offsets = self.encoding.decode_with_offsets(tokens)
+            for t in range(0, len(tokens), self.chunk_tokens):
+                piece_end = t + self.chunk_tokens
+                starts.append(start + token_offsets[t])
+                ends.append(start + token_offsets[piece_end] if piece_end < len(tokens) else int(offsets[i + 1]))
+                counts.append(min(self.chunk_tokens, len(tokens) - t))
+
+        return (
+            np.asarray(starts, dtype=np.int64),
+            np.asarray(ends, dtype=np.int64),
+            np.asarray(counts, dtype=np.int64),
+        )
+
+    def count_tokens(self, text: str) -> int:
+        """Count tiktoken tokens in a piece of text."""
+        return len(self.encoding.encode_ordinary(text))
+
+    def split(self, text: str) -> List[Dict[str, Any]]:
+        """Split text into overlapping chunks within the token budget.
+
+        Returns dicts with the chunk text, its character span and token count.
+        """
+        if not text or not text.strip():
+            return []
+
+        starts, ends, counts = self._segments(text)
+        # prefix[j] is the token count of all segments before j
+        prefix = np.concatenate(([0], np.cumsum(counts)))
+        n = len(counts)
+
+        chunks = []
+        s = 0
+        while s < n:
+            e = int(np.searchsorted(prefix, prefix[s] + self.chunk_tokens, side='right')) - 1
+            e = max(e, s + 1)
+            raw = text[starts[s]:ends[e - 1]]
+            chunk_text = raw.strip()
+            if chunk_text:
+                chunk_start = int(starts[s]) + len(raw) - len(raw.lstrip())
+                chunks.append({
+                    'text': chunk_text,
+                    'start': chunk_start,
+                    'end': chunk_start + len(chunk_text),
+                    'tokens': int(prefix[e] - prefix[s]),
+                })
+            if e >= n:
+                break
+            # Step back over whole sentences that fit in the overlap budget,
+            # unless the overlap would leave no room for the next segment
+            next_s = max(int(np.searchsorted(prefix, prefix[e] - self.overlap_tokens, side='left')), s + 1)
+            s = next_s if prefix[e + 1] - prefix[next_s] <= self.chunk_tokens else e
+
+        return chunks
+
+    def split_pages(self, pages: List[str]) -> List[Dict[str, Any]]:
+        """Split a list of page texts, tagging each chunk with its page range (1-based)."""
+        page_starts = []
+        parts = []
+        position = 0
+        for page in pages:
+            page_starts.append(position)
+            parts.append(page)
+            position += len(page) + 1
+        text = ' '.join(parts)
+        page_starts = np.asarray(page_starts, dtype=np.int64)
+
+        chunks = self.split(text)
+        if not chunks:
+            return []
+
+        chunk_starts = np.fromiter((c['start'] for c in chunks), dtype=np.int64, count=len(chunks))
+        chunk_ends = np.fromiter((c['end'] for c in chunks), dtype=np.int64, count=len(chunks))
+        first_pages = np.searchsorted(page_starts, chunk_starts, side='right')
+        last_pages = np.searchsorted(page_starts, np.maximum(chunk_ends - 1, chunk_starts), side='right')
+
+        for chunk, first, last in zip(chunks, first_pages, last_pages):
+            chunk['page'] = int(first)
+            chunk['page_end'] = int(last)
+        return chunks
@@ -1,11 +1,17 @@
 from langchain.tools import Tool
 from typing import List, Dict, Any
 import logging
+import json
+import hashlib
 from langchain_groq import ChatGroq
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
 import os
 from dotenv import load_dotenv
-from embedder import get_embedder
+from embedder import tenant_lease
+from tenants import DEFAULT_TENANT, UnknownTenantError
+from admission import AdmissionController, AdmissionRejected, SingleFlight
+from dedup import MinHasher, dedupe_results
+from conversation_state import ConversationState
 
 # Load environment variables
 load_dotenv()
@@ -14,18 +20,38 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_llm_response(query: str, context_chunks: List[Dict] = None, conversation_history: List[Dict] = None) -> str:
-    """Get LLM response based on search results and conversation history."""
-    try:
-        # Initialize LLM
-        llm = ChatGroq(
-            temperature=0.5,
-            model_name="mixtral-8x7b-32768",
-            groq_api_key=os.getenv("GROQ_API_KEY")
-        )
-        
-        # Create system message
-        system_message = """You are REAIC, a real estate AI consultant. You help users with property valuation, 
+# Identical concurrent retrievals/generations share one upstream call; only the
+# leader of each group takes a slot from the admission controller.
+retrieval_flight = SingleFlight()
+generation_flight = SingleFlight()
+retrieval_admission = AdmissionController(
+    "Document search",
+    max_concurrent=int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("RETRIEVAL_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+)
+llm_admission = AdmissionController(
+    "Language model",
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+)
+
+# Shared MinHash permutations for collapsing near-identical search results
+result_hasher = MinHasher()
+
+def _flight_key(*parts) -> str:
+    """Stable hash of JSON-serializable request parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_admission_stats() -> Dict[str, Any]:
+    """Return admission and coalescing counters for retrieval and generation."""
+    return {
+        'retrieval': {**retrieval_admission.get_stats(), **retrieval_flight.stats},
+        'generation': {**llm_admission.get_stats(), **generation_flight.stats}
+    }
+
+SYSTEM_PROMPT = """You are REAIC, a real estate AI consultant. You help users with property valuation, 
         market analysis, investment strategies, and transaction negotiations. Always be professional, helpful, 
         and respectful. Remember user names and preferences when provided.
         
@@ -41,41 +67,55 @@ def get_llm_response(query: str, context_chunks: List[Dict] = None, conversation
         2. Use your general knowledge about real estate
         3. Be clear about what information or documents would help provide better answers
         4. Remember and use the user's name and preferences throughout the conversation"""
+
+# Built once; message objects are never mutated after construction
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+def _history_message(msg: Dict):
+    """Convert a stored history entry to a LangChain message (None for other roles)."""
+    if msg['role'] == 'user':
+        return HumanMessage(content=msg['content'])
+    elif msg['role'] == 'assistant':
+        return AIMessage(content=msg['content'])
+    return None
+
+def get_llm_response(query: str, context_chunks: List[Dict] = None, conversation_history: List[Dict] = None,
+                     state: ConversationState = None) -> str:
+    """Get LLM response based on search results and conversation history.
+    
+    state is the conversation's cached derived state (ChatHistoryManager.get_state);
+    with it, the user's name, preferences and history messages are only
+    computed for messages appended since the previous turn.
+    """
+    try:
+        # Initialize LLM
+        llm = ChatGroq(
+            temperature=0.5,
+            model_name="mixtral-8x7b-32768",
+            groq_api_key=os.getenv("GROQ_API_KEY")
+        )
         
-        # Create messages list
-        messages = [
-            SystemMessage(content=system_message)
-        ]
+        # Create messages list: system/profile head, history, then context and query
+        head = [SYSTEM_MESSAGE]
+        history = []
         
         # Add conversation history
         if conversation_history:
-            # Extract user's name from history if available
-            user_name = None
-            for msg in conversation_history:
-                if msg['role'] == 'user':
-                    # Look for common name introduction patterns
-                    content = msg['content'].lower()
-                    if "my name is " in content:
-                        user_name = content.split("my name is ")[1].split()[0].title()
-                        break
-                    elif "i am " in content or "i'm " in content:
-                        after_am = content.split("i am " if "i am " in content else "i'm ")[1].split()[0].title()
-                        if len(after_am) > 2:  # Basic check to avoid "I am a..." cases
-                            user_name = after_am
-                            break
+            if state is None:
+                state = ConversationState()
+            history = state.history_messages(conversation_history, _history_message)
             
             # Add user context if found
-            if user_name:
-                messages.append(SystemMessage(
-                    content=f"The user's name is {user_name}. Always refer to them by name when appropriate."
+            if state.user_name:
+                head.append(SystemMessage(
+                    content=f"The user's name is {state.user_name}. Always refer to them by name when appropriate."
+                ))
+            if state.preferences:
+                head.append(SystemMessage(
+                    content=f"The user has mentioned: {'; '.join(state.preferences)}. Take this into account."
                 ))
-            
-            # Add conversation history
-            for msg in conversation_history:
-                if msg['role'] == 'user':
-                    messages.append(HumanMessage(content=msg['content']))
-                elif msg['role'] == 'assistant':
-                    messages.append(AIMessage(content=msg['content']))
+        
+        tail = []
         
         # Add document context if provided
         if context_chunks:
@@ -93,30 +133,53 @@ def get_llm_response(query: str, context_chunks: List[Dict] = None, conversation
                 if not content:
                     continue
                 
+                also_in = ', '.join(
+                    f"{ref['source']} (page {ref['page']})" for ref in metadata.get('also_in', [])
+                )
                 context_sections.append(
                     f"Document: {source}\n"
                     f"Page: {page_num}\n"
-                    f"Content: {content}\n"
+                    + (f"Also in: {also_in}\n" if also_in else "")
+                    + f"Content: {content}\n"
                 )
             
             if context_sections:
-                messages.append(
+                tail.append(
                     SystemMessage(content=f"Here is the relevant context from the documents:\n\n{chr(10).join(context_sections)}")
                 )
         
         # Add the current query
-        messages.append(HumanMessage(content=query))
+        tail.append(HumanMessage(content=query))
         
-        # Get response from LLM
-        response = llm.invoke(messages)
-        return response.content
+        # Get response from LLM, sharing the call with identical in-flight requests.
+        # The history is identified by its chained digest instead of rehashing every message.
+        key = _flight_key(
+            llm.model_name, llm.temperature,
+            [(message.type, message.content) for message in head],
+            state.history_digest if history else None,
+            [(message.type, message.content) for message in tail]
+        )
+        messages = head + history + tail
+        
+        def generate():
+            with llm_admission.admit():
+                return llm.invoke(messages).content
+        
+        return generation_flight.do(key, generate)
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         logger.error(f"Error getting LLM response: {str(e)}")
         return f"I apologize, but I encountered an error: {str(e)}"
 
-def search_documents(query: str, k: int = 4) -> List[Dict]:
-    """Search through embedded documents and return relevant information."""
+def search_documents(query: str, k: int = 4, tenant_id: str = DEFAULT_TENANT,
+                     filters: Dict[str, Any] = None) -> List[Dict]:
+    """Search through a tenant's embedded documents and return relevant information.
+    
+    Without explicit filters, documents mentioned by name in the query are used
+    as a source filter; if that finds nothing the search is retried unfiltered.
+    """
     try:
         if not query:
             logger.warning("Empty query received")
@@ -124,29 +187,45 @@ def search_documents(query: str, k: int = 4) -> List[Dict]:
             
         logger.info(f"Searching documents for query: {query}")
         
-        # Get embedder instance
-        embedder = get_embedder()
-        
-        # Check if vector store is empty
-        collection_size = len(embedder.vector_store.get()['ids']) if embedder.vector_store.get() else 0
-        if collection_size == 0:
-            logger.info("Vector store is empty")
-            return []
+        # Hold the tenant's embedder so eviction cannot close it mid-search
+        with tenant_lease(tenant_id) as embedder:
+            # Check if vector store is empty
+            if embedder.count() == 0:
+                logger.info("Vector store is empty")
+                return []
             
-        # Perform search
-        results = embedder.similarity_search(query, k=k)
-        return results
-        
+            # Narrow to documents the user named, if any
+            detected = False
+            if filters is None:
+                sources = embedder.detect_sources(query)
+                if sources:
+                    logger.info(f"Query mentions documents: {sources}")
+                    filters = {'source': sources}
+                    detected = True
+            
+            def retrieve():
+                with retrieval_admission.admit():
+                    results = embedder.similarity_search(query, k=k, filters=filters)
+                    if not results and detected:
+                        results = embedder.similarity_search(query, k=k)
+                    # Near-copies from different documents would only repeat context
+                    return dedupe_results(results, hasher=result_hasher)
+            
+            # Perform search, sharing it with identical in-flight searches
+            key = _flight_key(tenant_id, query.strip().lower(), k, filters)
+            return list(retrieval_flight.do(key, retrieve))
+            
+    except (AdmissionRejected, UnknownTenantError):
+        raise
     except Exception as e:
         logger.error(f"Error in search_documents: {str(e)}")
         return []
 
-def process_new_pdfs(file_paths: List[str]) -> Dict[str, Any]:
-    """Process new PDF files and add them to the vector store."""
+def process_new_pdfs(file_paths: List[str], tenant_id: str = DEFAULT_TENANT) -> Dict[str, Any]:
+    """Process new PDF files and add them to the tenant's vector store."""
     try:
-        embedder = get_embedder()
-        results = embedder.process_files(file_paths)
-        return results
+        with tenant_lease(tenant_id) as embedder:
+            return embedder.process_files(file_paths)
     except Exception as e:
         logger.error(f"Error processing PDFs: {str(e)}")
         return {"error": str(e)}